@@ -1,6 +1,6 @@
 {
     'name': 'Restriction Entrepot',
-    'version': '1.8.1',
+    'version': '1.9.0',
     'description': "Module de restriction d'entrepôt",
     'author': 'TOFTAL',
     'category': 'Inventory',
@@ -11,6 +11,9 @@
         'views/res_users_view.xml',
     'views/stock_restrict_destination_view.xml',
         'views/stock_location_view.xml',
+        'views/stock_warehouse_group_view.xml',
+        'data/stock_location_data.xml',
+        'data/ir_cron_data.xml',
     ],
     'installable': True,
     'application': False,
@@ -0,0 +1,7 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Classe les anciens emplacements Inter-Transit reconnus par leur nom"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['stock.location']._classify_legacy_inter_transit_locations()
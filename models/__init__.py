@@ -1 +1 @@
-from . import stock_restrict_destination, res_users
\ No newline at end of file
+from . import stock_restrict_destination, res_users, stock_warehouse_group
@@ -0,0 +1,300 @@
+from array import array
+
+# Usages des emplacements rattachés à l'entrepôt dont la racine est un ancêtre
+# (même règle que stock.location._compute_restriction_warehouse_id)
+TREE_USAGES = ('internal', 'view')
+
+# Nombre de modifications en attente au-delà duquel prepare() renumérote l'arbre
+MAX_PENDING_CHANGES = 512
+
+# Emplacement supprimé (voir LocationTreeIndex._changes)
+_REMOVED = None
+
+
+class LocationTreeIndex:
+    """
+    Index en mémoire de l'arbre des emplacements (ensembles imbriqués).
+
+    Chaque emplacement reçoit un intervalle [gauche, droite] issu d'un parcours en
+    profondeur: B est un descendant de A si gauche(A) <= gauche(B) <= droite(A).
+    L'entrepôt dont la racine est l'ancêtre le plus proche est calculé pendant le
+    parcours. Appartenance, descendance et entrepôt de restriction sont donc
+    résolus en temps constant, sans accès à la base.
+
+    Les modifications (apply()) ne renumérotent pas l'arbre: elles sont gardées à
+    côté de la numérotation, qui n'est jamais modifiée.
+    - Un emplacement ajouté ou déplacé est suivi par son parent actuel.
+    - Le sous-arbre numéroté d'un emplacement déplacé, supprimé ou dont la racine
+      d'entrepôt change n'est plus fiable.
+    Une requête remonte les parents actuels jusqu'au premier ancêtre hors de ces
+    sous-arbres, dont la numérotation répond. Le coût d'une modification ne dépend
+    donc pas de la taille de l'arbre. La numérotation complète n'est refaite que
+    par prepare(), au-delà de MAX_PENDING_CHANGES modifications.
+
+    La numérotation et les dictionnaires chargés ne sont jamais modifiés sur place:
+    copy() les partage et ne copie que les modifications.
+    """
+
+    def __init__(self, rows, warehouse_roots):
+        """
+        Args:
+            rows: Itérable de tuples (id, parent_id, usage, transit_warehouse_id)
+            warehouse_roots: Dictionnaire {id de l'emplacement racine: id de l'entrepôt}
+        """
+        parent, usage, transit = {}, {}, {}
+        for location_id, parent_id, location_usage, transit_warehouse_id in rows:
+            parent[location_id] = parent_id or None
+            usage[location_id] = location_usage
+            if transit_warehouse_id:
+                transit[location_id] = transit_warehouse_id
+        self._build(parent, usage, transit, dict(warehouse_roots))
+
+    def _build(self, parent, usage, transit, warehouse_roots):
+        """Numérote l'arbre (parcours en profondeur itératif) et vide les modifications"""
+        children = {}
+        roots = []
+        for location_id, parent_id in parent.items():
+            if parent_id is None or parent_id not in parent:
+                roots.append(location_id)
+            else:
+                children.setdefault(parent_id, []).append(location_id)
+
+        size = len(parent)
+        ids = array('q')
+        right = array('q', bytes(8 * size))
+        root_warehouse = array('q', bytes(8 * size))
+        position_by_id = {}
+
+        for root_id in sorted(roots):
+            # (emplacement, entrepôt de la racine la plus proche, sortie du nœud)
+            stack = [(root_id, 0, False)]
+            while stack:
+                location_id, warehouse_id, leaving = stack.pop()
+                if leaving:
+                    right[position_by_id[location_id]] = len(ids) - 1
+                    continue
+                warehouse_id = warehouse_roots.get(location_id, warehouse_id)
+                position = len(ids)
+                position_by_id[location_id] = position
+                ids.append(location_id)
+                root_warehouse[position] = warehouse_id
+                stack.append((location_id, warehouse_id, True))
+                for child_id in sorted(children.get(location_id, ()), reverse=True):
+                    stack.append((child_id, warehouse_id, False))
+
+        # Numérotation et état chargé: partagés entre copies, jamais modifiés
+        self._base_parent = parent
+        self._base_usage = usage
+        self._base_transit = transit
+        self._ids = ids
+        self._right = right
+        self._root_warehouse = root_warehouse
+        self._position = position_by_id
+        # Modifications depuis la numérotation: {id: (parent_id, usage, transit_warehouse_id) ou _REMOVED}
+        self._changes = {}
+        # Emplacements ajoutés ou déplacés, suivis par leur parent actuel
+        self._moved = set()
+        # Intervalles numérotés [gauche, droite] dont l'entrepôt de restriction n'est plus fiable
+        self._stale = []
+        self._warehouse_roots = warehouse_roots
+        self._size = size
+
+    def prepare(self):
+        """
+        Renumérote l'arbre si les modifications en attente sont trop nombreuses:
+        à appeler avant de partager l'index entre threads (aucune requête ne le modifie).
+        """
+        if len(self._changes) + len(self._stale) <= MAX_PENDING_CHANGES:
+            return
+        parent, usage, transit = dict(self._base_parent), dict(self._base_usage), dict(self._base_transit)
+        for location_id, node in self._changes.items():
+            if node is _REMOVED:
+                parent.pop(location_id, None)
+                usage.pop(location_id, None)
+                transit.pop(location_id, None)
+                continue
+            parent[location_id], usage[location_id], transit_warehouse_id = node
+            if transit_warehouse_id:
+                transit[location_id] = transit_warehouse_id
+            else:
+                transit.pop(location_id, None)
+        self._build(parent, usage, transit, dict(self._warehouse_roots))
+
+    def copy(self):
+        """Copie indépendante (les modifications de la copie ne touchent pas l'original)"""
+        index = LocationTreeIndex.__new__(LocationTreeIndex)
+        index.__dict__.update(self.__dict__)
+        index._changes = dict(self._changes)
+        index._moved = set(self._moved)
+        index._stale = list(self._stale)
+        index._warehouse_roots = dict(self._warehouse_roots)
+        return index
+
+    def _node(self, location_id):
+        """(parent_id, usage, transit_warehouse_id) actuels, ou _REMOVED si absent"""
+        if location_id in self._changes:
+            return self._changes[location_id]
+        if location_id not in self._base_parent:
+            return _REMOVED
+        return (
+            self._base_parent[location_id],
+            self._base_usage[location_id],
+            self._base_transit.get(location_id),
+        )
+
+    def _parent_of(self, location_id):
+        node = self._node(location_id)
+        return node[0] if node is not _REMOVED else None
+
+    def _reliable_position(self, location_id):
+        """Position numérotée de l'emplacement si ses ancêtres n'ont pas changé, sinon None"""
+        if location_id in self._moved or location_id in self._changes and self._changes[location_id] is _REMOVED:
+            return None
+        position = self._position.get(location_id)
+        if position is None:
+            return None
+        for left, right in self._stale:
+            if left <= position <= right:
+                return None
+        return position
+
+    def _mark_stale(self, location_id):
+        """Le sous-arbre numéroté de l'emplacement n'est plus fiable"""
+        position = self._position.get(location_id)
+        if position is not None:
+            self._stale.append((position, self._right[position]))
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, location_id):
+        return self._node(location_id) is not _REMOVED
+
+    def add(self, location_id, parent_id, usage, transit_warehouse_id=None):
+        """Ajoute un emplacement sous `parent_id`"""
+        if location_id not in self:
+            self._size += 1
+        self._changes[location_id] = (parent_id or None, usage, transit_warehouse_id or None)
+        self._moved.add(location_id)
+
+    def move(self, location_id, parent_id):
+        """Déplace un emplacement et son sous-arbre, sans renuméroter l'arbre"""
+        _parent_id, usage, transit_warehouse_id = self._node(location_id)
+        self._changes[location_id] = (parent_id or None, usage, transit_warehouse_id)
+        if location_id not in self._moved:
+            self._moved.add(location_id)
+            self._mark_stale(location_id)
+
+    def _update(self, location_id, usage, transit_warehouse_id):
+        """Met à jour l'usage et l'entrepôt de transit d'un emplacement"""
+        node = self._node(location_id)
+        if node[1:] != (usage, transit_warehouse_id or None):
+            self._changes[location_id] = (node[0], usage, transit_warehouse_id or None)
+
+    def set_warehouse_root(self, location_id, warehouse_id):
+        """Déclare (ou retire si `warehouse_id` est vide) la racine d'un entrepôt"""
+        if (self._warehouse_roots.get(location_id) or False) == (warehouse_id or False):
+            return
+        if warehouse_id:
+            self._warehouse_roots[location_id] = warehouse_id
+        else:
+            self._warehouse_roots.pop(location_id, None)
+        self._mark_stale(location_id)
+
+    def remove(self, location_id):
+        """Retire un emplacement supprimé (ses enfants éventuels deviennent des racines)"""
+        if location_id not in self:
+            return
+        self._changes[location_id] = _REMOVED
+        self._moved.discard(location_id)
+        self._mark_stale(location_id)
+        self._size -= 1
+
+    def apply(self, changes):
+        """
+        Applique des modifications enregistrées par une transaction.
+
+        Args:
+            changes: Itérable de tuples ('upsert', id, parent_id, usage, transit_warehouse_id),
+                     ('remove', id) ou ('root', id de l'emplacement, id de l'entrepôt ou False)
+
+        Returns:
+            False si une modification référence un emplacement absent de l'index (par
+            exemple un parent créé sans rattachement possible): l'index doit alors être
+            rechargé, il n'est plus exact
+        """
+        for change in changes:
+            if change[0] == 'upsert':
+                location_id, parent_id, usage, transit_warehouse_id = change[1:]
+                if parent_id and parent_id not in self:
+                    return False
+                if location_id not in self:
+                    self.add(location_id, parent_id, usage, transit_warehouse_id)
+                    continue
+                if self._parent_of(location_id) != (parent_id or None):
+                    self.move(location_id, parent_id)
+                self._update(location_id, usage, transit_warehouse_id)
+            elif change[0] == 'remove':
+                self.remove(change[1])
+            elif change[0] == 'root':
+                if change[1] not in self:
+                    return False
+                self.set_warehouse_root(change[1], change[2])
+        return True
+
+    def is_descendant(self, location_id, ancestor_id):
+        """True si `location_id` est `ancestor_id` ou l'un de ses descendants"""
+        node_id = location_id
+        while node_id is not None and node_id in self:
+            if node_id == ancestor_id:
+                return True
+            position = self._reliable_position(node_id)
+            if position is not None:
+                # Ancêtres inchangés: un ancêtre modifié ne peut pas en faire partie
+                ancestor = self._reliable_position(ancestor_id)
+                return ancestor is not None and ancestor <= position <= self._right[ancestor]
+            node_id = self._parent_of(node_id)
+        return False
+
+    def descendant_ids(self, ancestor_id):
+        """IDs de `ancestor_id` et de ses descendants"""
+        if ancestor_id not in self:
+            return []
+        ancestor = self._position.get(ancestor_id)
+        if not self._changes and not self._stale:
+            return self._ids[ancestor:self._right[ancestor] + 1].tolist()
+        # Candidats: sous-arbre numéroté de l'ancêtre et des emplacements rattachés
+        # depuis sous lui, filtrés selon les parents actuels
+        candidates = set()
+        if ancestor is not None:
+            candidates.update(self._ids[ancestor:self._right[ancestor] + 1])
+        for location_id in self._moved:
+            if self.is_descendant(location_id, ancestor_id):
+                candidates.add(location_id)
+                position = self._position.get(location_id)
+                if position is not None:
+                    candidates.update(self._ids[position:self._right[position] + 1])
+        return [location_id for location_id in candidates if self.is_descendant(location_id, ancestor_id)]
+
+    def warehouse_of(self, location_id):
+        """
+        Entrepôt de restriction d'un emplacement: l'entrepôt de transit s'il est
+        défini, sinon (emplacements internes et virtuels) l'entrepôt dont la racine
+        est l'ancêtre le plus proche. Retourne False si aucun.
+        """
+        node = self._node(location_id)
+        if node is _REMOVED:
+            return False
+        if node[2]:
+            return node[2]
+        if node[1] not in TREE_USAGES:
+            return False
+        node_id = location_id
+        while node_id is not None and node_id in self:
+            position = self._reliable_position(node_id)
+            if position is not None:
+                return self._root_warehouse[position] or False
+            if node_id in self._warehouse_roots:
+                return self._warehouse_roots[node_id]
+            node_id = self._parent_of(node_id)
+        return False
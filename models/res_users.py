@@ -1,4 +1,12 @@
-from odoo import models, fields
+from odoo import models, fields, api
+
+from . import restriction_cache
+
+# Profils de restriction d'un utilisateur (voir ResUsers._get_restriction_profile)
+PROFILE_UNRESTRICTED = 'unrestricted'   # Administrateur, gestionnaire ou hors groupe de restriction
+PROFILE_RESTRICTED = 'restricted'       # Groupe de restriction avec entrepôts assignés
+PROFILE_NO_WAREHOUSE = 'no_warehouse'   # Groupe de restriction sans entrepôt assigné
+
 
 class ResUsers(models.Model):
     _inherit = 'res.users'
@@ -8,3 +16,61 @@ class ResUsers(models.Model):
         string="Entrepôts",
         help="Entrepôts assignés à cet utilisateur pour les restrictions d'emplacements"
     )
+    warehouse_group_ids = fields.Many2many(
+        'stock.warehouse.group',
+        'res_users_stock_warehouse_group_rel',
+        'user_id',
+        'group_id',
+        string="Groupes d'entrepôts",
+        help="Groupes d'entrepôts (régions) assignés à cet utilisateur: leurs entrepôts "
+             "s'ajoutent aux entrepôts assignés individuellement"
+    )
+    restriction_warehouse_ids = fields.Many2many(
+        'stock.warehouse',
+        string="Entrepôts effectifs",
+        compute='_compute_restriction_warehouse_ids',
+        compute_sudo=True,
+        help="Entrepôts assignés directement ou via un groupe d'entrepôts"
+    )
+
+    @api.depends('warehouse_ids', 'warehouse_group_ids.warehouse_ids', 'warehouse_group_ids.active')
+    def _compute_restriction_warehouse_ids(self):
+        for user in self:
+            user.restriction_warehouse_ids = user.warehouse_ids | user.warehouse_group_ids.warehouse_ids
+
+    def _get_restriction_profile(self):
+        """
+        Retourne le profil de restriction de l'utilisateur, calculé une seule fois.
+
+        Regroupe les vérifications de groupes (système, gestionnaire de stock,
+        restriction d'entrepôt) et les entrepôts effectifs (directs et via les groupes
+        d'entrepôts) consultés par toutes les surcharges. Les groupes sont vérifiés
+        par has_group(), mis en cache et vidé par Odoo: un utilisateur sans
+        restriction ne lit pas la version des caches de restriction. Les entrepôts
+        effectifs d'un utilisateur restreint sont mis en cache (restriction_cache) et
+        invalidés lors d'un changement d'entrepôts ou de groupes d'entrepôts.
+
+        Returns:
+            Tuple (profil, tuple des IDs d'entrepôts effectifs)
+        """
+        self.ensure_one()
+        if self.has_group('base.group_system') or self.has_group('stock.group_stock_manager') \
+                or not self.has_group('restric_entrepot1.group_entrepot_restric'):
+            return PROFILE_UNRESTRICTED, ()
+        return restriction_cache.cached(self.env.cr, restriction_cache.PROFILES, self.id, self._load_restriction_profile)
+
+    def _load_restriction_profile(self):
+        """Calcule le profil d'un utilisateur restreint, mis en cache par _get_restriction_profile()"""
+        warehouse_ids = tuple(sorted(self.sudo().restriction_warehouse_ids.ids))
+        if not warehouse_ids:
+            return PROFILE_NO_WAREHOUSE, ()
+        return PROFILE_RESTRICTED, warehouse_ids
+
+    def write(self, vals):
+        res = super().write(vals)
+        # Les entrepôts effectifs mis en cache dépendent des affectations; les groupes
+        # sont vérifiés par has_group(), dont Odoo vide lui-même le cache
+        if 'warehouse_ids' in vals or 'warehouse_group_ids' in vals:
+            self.env['stock.location']._invalidate_allowed_location_cache(assignments=True)
+        return res
+
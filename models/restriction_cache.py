@@ -0,0 +1,302 @@
+import threading
+
+from odoo.sql_db import db_connect
+from odoo.tools.sql import table_exists
+
+# Compteur (une seule ligne) incrémenté dans la transaction qui modifie les données
+# de restriction: la version appartient au même instantané que les données
+VERSION_TABLE = 'restric_entrepot1_version'
+
+# Données de la transaction (cr.postcommit.data: vidées au commit et au rollback)
+VERSION_KEY = 'restric_entrepot1.restriction_version'
+PRIVATE_STORE_KEY = 'restric_entrepot1.restriction_store'
+CHANGED_KEY = 'restric_entrepot1.restriction_changed'
+# Modifications de la transaction: {'base_version', 'base_entries', 'increments',
+# 'invalidated' (None: tous les espaces de noms), 'tree_changes' (None: inapplicables)}
+CHANGES_KEY = 'restric_entrepot1.restriction_changes'
+
+# Espaces de noms: index de l'arbre des emplacements (voir get_tree) et profils des
+# utilisateurs restreints
+TREE = 'tree'
+PROFILES = 'profiles'
+
+# Nombre maximal d'entrées par espace de noms (profils)
+MAX_ENTRIES = 8192
+
+
+def init_version_table(cr):
+    """Crée le compteur de version des données de restriction (installation, mise à jour)"""
+    cr.execute("""
+        CREATE TABLE IF NOT EXISTS %s (
+            id integer PRIMARY KEY CHECK (id = 1),
+            version bigint NOT NULL DEFAULT 0
+        )
+    """ % VERSION_TABLE)
+    cr.execute("INSERT INTO %s (id) VALUES (1) ON CONFLICT (id) DO NOTHING" % VERSION_TABLE)
+
+
+class VersionedStore:
+    """
+    Entrées partagées par les threads d'un processus pour une base, étiquetées par
+    la version des données de restriction qui les a produites.
+
+    La version ne fait qu'augmenter: seules les entrées de la version la plus
+    récente demandée sont conservées. Une transaction plus ancienne (instantané
+    antérieur au dernier commit) n'y a pas accès.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.entries = {}
+
+    def get(self, version):
+        """
+        Returns:
+            Dictionnaire des entrées de `version`, ou None si le cache est plus récent
+        """
+        with self._lock:
+            if self.version is None or version > self.version:
+                self.version = version
+                self.entries = {}
+            if version != self.version:
+                return None
+            return self.entries
+
+    def replace(self, base_version, base_entries, version, entries):
+        """
+        Remplace les entrées de `base_version` par celles de `version`, si le cache
+        n'a pas changé entre-temps.
+
+        Returns:
+            True si le remplacement a eu lieu
+        """
+        with self._lock:
+            if self.version != base_version or self.entries is not base_entries:
+                return False
+            self.version = version
+            self.entries = entries
+            return True
+
+
+_stores_lock = threading.Lock()
+# Caches partagés du processus: {dbname: VersionedStore}
+_stores = {}
+# Bases dont la table de version existe (la mise à jour du module la crée)
+_ready_dbnames = set()
+
+
+def _get_shared_store(dbname):
+    with _stores_lock:
+        store = _stores.get(dbname)
+        if store is None:
+            store = _stores[dbname] = VersionedStore()
+        return store
+
+
+def get_version(cr):
+    """
+    Version des données de restriction visible par la transaction, lue une fois et
+    seulement quand un cache en a besoin (voir cached(), get_tree()).
+
+    Returns:
+        Entier, ou None tant que la table de version n'existe pas
+    """
+    data = cr.postcommit.data
+    if VERSION_KEY not in data:
+        version = None
+        if cr.dbname in _ready_dbnames or table_exists(cr, VERSION_TABLE):
+            _ready_dbnames.add(cr.dbname)
+            cr.execute("SELECT version FROM %s" % VERSION_TABLE)
+            row = cr.fetchone()
+            version = row[0] if row else None
+        data[VERSION_KEY] = version
+    return data[VERSION_KEY]
+
+
+def get_store(cr):
+    """
+    Entrées de cache utilisables par la transaction courante.
+
+    Les entrées partagées du processus si la transaction voit la version la plus
+    récente et n'a rien modifié; sinon des entrées privées, abandonnées à la fin
+    de la transaction.
+
+    Returns:
+        Dictionnaire {espace de noms: valeur}
+    """
+    data = cr.postcommit.data
+    store = data.get(PRIVATE_STORE_KEY)
+    if store is not None:
+        return store
+    version = get_version(cr)
+    if version is not None:
+        store = _get_shared_store(cr.dbname).get(version)
+    if store is None:
+        store = data[PRIVATE_STORE_KEY] = {}
+    return store
+
+
+def cached(cr, namespace, key, compute):
+    """
+    Valeur de `key` dans l'espace de noms `namespace`, calculée par `compute()`
+    au premier appel. L'espace de noms est vidé au-delà de MAX_ENTRIES entrées.
+    """
+    entries = get_store(cr).setdefault(namespace, {})
+    try:
+        return entries[key]
+    except KeyError:
+        pass
+    value = compute()
+    if len(entries) >= MAX_ENTRIES:
+        entries.clear()
+    entries[key] = value
+    return value
+
+
+def get_tree(cr, build):
+    """
+    Index de l'arbre des emplacements utilisable par la transaction courante.
+
+    Dans une transaction qui a modifié l'arbre, l'index partagé au début de la
+    transaction est copié et les modifications y sont appliquées, plutôt que de le
+    recharger entièrement.
+
+    Args:
+        build: Fonction sans argument qui charge l'index depuis la base
+    """
+    store = get_store(cr)
+    tree = store.get(TREE)
+    if tree is not None:
+        return tree
+    changes = cr.postcommit.data.get(CHANGES_KEY)
+    base_tree = changes and changes['base_entries'] and changes['base_entries'].get(TREE)
+    if base_tree is not None and changes['tree_changes'] is not None:
+        tree = base_tree.copy()
+        if not tree.apply(changes['tree_changes']):
+            tree = None
+    if tree is None:
+        # Chargé après les modifications de la transaction: elles y figurent déjà
+        tree = build()
+    store[TREE] = tree
+    return tree
+
+
+def mark_changed(cr, namespaces=None, tree_changes=()):
+    """
+    Enregistre une modification des données de restriction dans la transaction.
+
+    Le compteur incrémenté est validé (ou annulé) avec la modification: les autres
+    transactions voient la nouvelle version exactement quand elles voient les
+    nouvelles données. La ligne du compteur reste verrouillée jusqu'à la fin de la
+    transaction: deux modifications concurrentes des restrictions se succèdent (la
+    seconde est rejouée par Odoo après une erreur de sérialisation). Les lectures
+    ne sont jamais bloquées. Jusqu'à la fin de la transaction, ses caches sont privés:
+    les entrées partagées non invalidées y sont copiées.
+
+    Après le commit, si aucune autre modification n'a été validée entre-temps, les
+    entrées partagées non invalidées et l'index de l'arbre (modifications
+    appliquées) sont reportés sur la nouvelle version au lieu d'être recalculés.
+
+    Args:
+        namespaces: Espaces de noms invalidés (None: tous, sauf l'index de l'arbre)
+        tree_changes: Modifications de l'arbre des emplacements (LocationTreeIndex.apply())
+    """
+    data = cr.postcommit.data
+    changes = data.get(CHANGES_KEY)
+    if changes is None:
+        version = get_version(cr)
+        shared = _get_shared_store(cr.dbname)
+        base_entries = shared.get(version) if version is not None and PRIVATE_STORE_KEY not in data else None
+        changes = data[CHANGES_KEY] = {
+            'base_version': version,
+            'base_entries': base_entries,
+            'increments': 0,
+            'invalidated': set(),
+            'tree_changes': [],
+        }
+        private = data.get(PRIVATE_STORE_KEY)
+        if private is None:
+            private = {
+                namespace: dict(entries)
+                for namespace, entries in (base_entries or {}).items() if namespace != TREE
+            }
+        data[PRIVATE_STORE_KEY] = private
+        if version is not None:
+            dbname = cr.dbname
+            cr.postcommit.add(lambda: _carry_over(dbname, changes))
+    data[CHANGED_KEY] = True
+
+    private = data[PRIVATE_STORE_KEY]
+    if namespaces is None:
+        changes['invalidated'] = None
+    elif changes['invalidated'] is not None:
+        changes['invalidated'].update(namespaces)
+    for namespace in list(private):
+        if namespace != TREE and (namespaces is None or namespace in namespaces):
+            del private[namespace]
+
+    if tree_changes:
+        if changes['tree_changes'] is not None:
+            changes['tree_changes'].extend(tree_changes)
+        tree = private.get(TREE)
+        if tree is not None and not tree.apply(tree_changes):
+            # Modification non applicable: l'index sera rechargé depuis la base
+            del private[TREE]
+            changes['tree_changes'] = None
+
+    if cr.dbname in _ready_dbnames or table_exists(cr, VERSION_TABLE):
+        _ready_dbnames.add(cr.dbname)
+        # Un incrément par appel: un retour à un point de sauvegarde n'efface pas
+        # la trace des modifications faites ensuite dans la même transaction
+        cr.execute("UPDATE %s SET version = version + 1" % VERSION_TABLE)
+        changes['increments'] += 1
+
+
+def _carry_over(dbname, changes):
+    """Après le commit: reporte les entrées encore valides sur la nouvelle version"""
+    base_entries = changes['base_entries']
+    if not base_entries or not changes['increments']:
+        return
+    with db_connect(dbname).cursor() as version_cr:
+        version_cr.execute("SELECT version FROM %s" % VERSION_TABLE)
+        version = version_cr.fetchone()[0]
+    if version != changes['base_version'] + changes['increments']:
+        # Autre modification validée entre-temps: les caches seront recalculés
+        return
+
+    invalidated = changes['invalidated']
+    entries = {}
+    if invalidated is not None:
+        entries = {
+            namespace: namespace_entries for namespace, namespace_entries in base_entries.items()
+            if namespace != TREE and namespace not in invalidated
+        }
+    tree = base_entries.get(TREE)
+    if tree is not None and changes['tree_changes'] is not None:
+        if changes['tree_changes']:
+            tree = tree.copy()
+            if not tree.apply(changes['tree_changes']):
+                tree = None
+        if tree is not None:
+            tree.prepare()
+            entries[TREE] = tree
+    _get_shared_store(dbname).replace(changes['base_version'], base_entries, version, entries)
+
+
+def is_changed(cr):
+    """True si la transaction a modifié les données de restriction"""
+    return bool(cr.postcommit.data.get(CHANGED_KEY))
+
+
+def reset_transaction(cr):
+    """Oublie la version et les caches privés de la transaction (ex: entre deux tests)"""
+    for key in (VERSION_KEY, PRIVATE_STORE_KEY, CHANGED_KEY, CHANGES_KEY):
+        cr.postcommit.data.pop(key, None)
+
+
+def clear_shared(dbname):
+    """Oublie les caches partagés du processus pour une base (ex: après un test)"""
+    with _stores_lock:
+        _stores.pop(dbname, None)
+
@@ -0,0 +1,140 @@
+from odoo.osv import expression
+
+from .res_users import PROFILE_UNRESTRICTED, PROFILE_RESTRICTED
+
+# Feuilles qui ne peuvent correspondre à aucun enregistrement (les IDs sont positifs)
+EMPTY_LEAVES = (tuple(expression.FALSE_LEAF), ('id', '=', 0))
+
+
+def _is_conjunction(domain):
+    """True si le domaine est une simple conjonction de feuilles (aucun '|' ni '!')"""
+    return all(
+        element == expression.AND_OPERATOR or expression.is_leaf(element)
+        for element in domain
+    )
+
+
+def _in_values(leaf):
+    """Valeurs d'une feuille `in` fusionnable (liste d'IDs), None sinon"""
+    if leaf[1] != 'in' or not isinstance(leaf[2], (list, tuple, set, frozenset)):
+        return None
+    return leaf[2]
+
+
+def _is_mergeable_field(model, name):
+    """
+    True si une feuille `in` sur ce champ filtre une seule colonne de la table du
+    modèle (champ stocké, scalaire ou many2one): deux feuilles sur ce champ ne peuvent
+    alors correspondre qu'à l'intersection de leurs listes.
+
+    Ce n'est pas le cas d'un x2many (un transfert peut avoir un mouvement de chaque
+    liste), d'un chemin (`picking_type_id.warehouse_id`) ou d'un champ non stocké.
+    """
+    if name == 'id':
+        return True
+    field = model._fields.get(name)
+    return bool(field and field.store and field.column_type and not field.translate)
+
+
+def is_empty_restriction(domain):
+    """True si le domaine ne peut retourner aucun enregistrement, sans interroger la base"""
+    if not _is_conjunction(domain):
+        return False
+    for element in domain:
+        if element == expression.AND_OPERATOR:
+            continue
+        if tuple(element) in EMPTY_LEAVES:
+            return True
+        values = _in_values(element)
+        if values is not None and not values:
+            return True
+    return False
+
+
+def optimize_restriction_domain(model, args, restriction_domain):
+    """
+    Combine (ET) le domaine d'une recherche et le domaine de restriction.
+
+    Lorsque les deux domaines sont de simples conjonctions, les feuilles identiques
+    sont dédoublonnées et les feuilles `in` portant sur un même champ sont fusionnées
+    (intersection des listes), uniquement pour les colonnes du modèle
+    (voir _is_mergeable_field()). Sinon, les domaines sont simplement concaténés.
+
+    Args:
+        model: Modèle recherché (ex: self dans _search())
+        args: Domaine de la recherche (éventuellement vide)
+        restriction_domain: Domaine de restriction de l'utilisateur
+
+    Returns:
+        Domaine combiné, ou None si le résultat est vide par construction
+        (la recherche peut alors être court-circuitée sans requête SQL)
+    """
+    args = list(args or [])
+    if is_empty_restriction(restriction_domain):
+        return None
+    if not (_is_conjunction(args) and _is_conjunction(restriction_domain)):
+        return args + restriction_domain
+
+    leaves = []
+    seen = set()
+    in_leaves = {}
+    for element in args + restriction_domain:
+        if element == expression.AND_OPERATOR:
+            continue
+        if tuple(element) in EMPTY_LEAVES:
+            return None
+        field, operator, value = element
+        values = _in_values(element)
+        if values is not None and _is_mergeable_field(model, field):
+            if field in in_leaves:
+                # Deux feuilles `in` sur le même champ: seule l'intersection peut correspondre
+                index, merged = in_leaves[field]
+                allowed = set(values)
+                merged = [v for v in merged if v in allowed]
+                in_leaves[field] = (index, merged)
+                leaves[index] = (field, 'in', merged)
+            else:
+                merged = list(dict.fromkeys(values))
+                in_leaves[field] = (len(leaves), merged)
+                leaves.append((field, 'in', merged))
+            if not in_leaves[field][1]:
+                return None
+            continue
+        try:
+            key = (field, operator, value)
+            hash(key)
+        except TypeError:
+            leaves.append(element)
+            continue
+        if key not in seen:
+            seen.add(key)
+            leaves.append(element)
+    return leaves
+
+
+def restrict_search_domain(model, args, build_restriction):
+    """
+    Domaine d'une recherche (_search()) restreinte selon le profil de l'utilisateur.
+
+    Utilisateurs hors restriction: domaine inchangé. Utilisateurs restreints: domaine
+    combiné à build_restriction(IDs des entrepôts) par optimize_restriction_domain().
+    Utilisateurs sans entrepôt: aucun résultat.
+
+    Args:
+        model: Modèle recherché (self dans _search())
+        args: Domaine de la recherche
+        build_restriction: Fonction (liste des IDs d'entrepôts du profil) -> domaine de restriction
+
+    Returns:
+        Domaine à rechercher, ou None si le résultat est vide par construction
+        (retourner alors model.browse()._as_query(), sans requête SQL)
+    """
+    profile, warehouse_ids = model.env.user._get_restriction_profile()
+    if profile == PROFILE_UNRESTRICTED:
+        return args
+    if profile == PROFILE_RESTRICTED:
+        restriction_domain = build_restriction(list(warehouse_ids))
+    else:
+        # Pas d'entrepôt assigné = ne rien voir
+        restriction_domain = [('id', '=', 0)]
+    return optimize_restriction_domain(model, args, restriction_domain)
@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+from functools import wraps
+
+from odoo.tools.query import Query
+
+_logger = logging.getLogger(__name__)
+
+# Paramètre système activant l'instrumentation (valeur '1' ou 'True')
+INSTRUMENTATION_PARAM = 'restric_entrepot1.instrumentation'
+# Intervalle minimal (secondes) entre deux résumés dans les logs
+SUMMARY_INTERVAL = 300
+# Nombre de lignes du résumé (entrées les plus coûteuses)
+SUMMARY_SIZE = 20
+
+_stats_lock = threading.Lock()
+_stats = {}
+_last_summary = [time.monotonic()]
+
+
+def _is_enabled(env):
+    # get_param est mis en cache par l'ORM: aucune requête une fois le cache rempli
+    value = env['ir.config_parameter'].sudo().get_param(INSTRUMENTATION_PARAM, '')
+    return value.strip().lower() in ('1', 'true')
+
+
+def _count_query_params(result):
+    """Nombre de paramètres SQL de la requête générée (reflète la taille du domaine)"""
+    if not isinstance(result, Query):
+        return 0
+    select = result.select()
+    params = select.params if hasattr(select, 'params') else select[1]
+    return len(params)
+
+
+def _record(key, nb_warehouses, queries, params, duration):
+    with _stats_lock:
+        entry = _stats.setdefault(key, {
+            'calls': 0, 'warehouses': 0, 'queries': 0, 'params': 0, 'time': 0.0, 'max_time': 0.0,
+        })
+        entry['calls'] += 1
+        entry['warehouses'] = nb_warehouses
+        entry['queries'] += queries
+        entry['params'] += params
+        entry['time'] += duration
+        entry['max_time'] = max(entry['max_time'], duration)
+
+        now = time.monotonic()
+        if now - _last_summary[0] < SUMMARY_INTERVAL:
+            return
+        _last_summary[0] = now
+        snapshot = sorted(_stats.items(), key=lambda item: item[1]['time'], reverse=True)
+        _stats.clear()
+
+    _log_summary(snapshot[:SUMMARY_SIZE])
+
+
+def _log_summary(entries):
+    lines = [
+        "%s.%s uid=%s profil=%s entrepôts=%s appels=%s requêtes=%s paramètres=%s total=%.1fms max=%.1fms" % (
+            model, method, uid, profile, entry['warehouses'], entry['calls'], entry['queries'],
+            entry['params'], entry['time'] * 1000, entry['max_time'] * 1000,
+        )
+        for (model, method, uid, profile), entry in entries
+    ]
+    _logger.info("Coût de la couche de restriction (%s entrées):\n%s", len(lines), '\n'.join(lines))
+
+
+def instrument_restriction(method):
+    """
+    Décorateur mesurant une méthode de la couche de restriction lorsque le paramètre
+    système INSTRUMENTATION_PARAM est actif.
+
+    Pour chaque appel sont relevés: modèle, utilisateur, profil de restriction, nombre
+    d'entrepôts, nombre de requêtes SQL, nombre de paramètres de la requête générée
+    et durée. Les mesures sont agrégées en mémoire (par processus) et un résumé des
+    entrées les plus coûteuses est écrit dans les logs au plus toutes les
+    SUMMARY_INTERVAL secondes.
+
+    À placer au plus près de la définition (sous @api.model, @api.depends, ...).
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        env = self.env
+        if not _is_enabled(env):
+            return method(self, *args, **kwargs)
+
+        profile, warehouse_ids = env.user._get_restriction_profile()
+        query_count = env.cr.sql_log_count
+        start = time.perf_counter()
+        result = method(self, *args, **kwargs)
+        duration = time.perf_counter() - start
+        queries = env.cr.sql_log_count - query_count
+
+        key = (self._name, method.__name__, env.uid, profile)
+        _record(key, len(warehouse_ids), queries, _count_query_params(result), duration)
+        return result
+
+    return wrapper
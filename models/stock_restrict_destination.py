@@ -1,5 +1,47 @@
+import logging
+import time
+
 from odoo import models, fields, api, _
-from odoo.exceptions import ValidationError
+from odoo.exceptions import AccessError, ValidationError
+from odoo.osv import expression
+from odoo.tools.sql import column_exists, create_column, create_index
+
+from .res_users import PROFILE_UNRESTRICTED, PROFILE_RESTRICTED
+from .restriction_instrumentation import instrument_restriction
+from .restriction_domain import optimize_restriction_domain, restrict_search_domain
+from .location_tree_index import LocationTreeIndex
+from . import restriction_cache
+
+_logger = logging.getLogger(__name__)
+
+
+def _execute_in_batches(cr, table, query, params, batch_size):
+    """
+    Exécute une requête UPDATE par tranches d'IDs de `table`.
+
+    La requête reçoit les paramètres nommés `start` et `stop` (bornes incluses)
+    en plus de `params`. Retourne le nombre total de lignes mises à jour.
+    """
+    cr.execute("SELECT MIN(id), MAX(id) FROM %s" % table)
+    min_id, max_id = cr.fetchone()
+    if min_id is None:
+        return 0
+    updated = 0
+    for start in range(min_id, max_id + 1, batch_size):
+        cr.execute(query, dict(params, start=start, stop=start + batch_size - 1))
+        updated += cr.rowcount
+    return updated
+
+
+# Champs dont la modification change l'ensemble des emplacements autorisés
+LOCATION_RESTRICTION_FIELDS = ('transit_warehouse_id', 'location_id', 'usage', 'active')
+
+# Usages des emplacements rattachés à l'entrepôt dont la racine est un ancêtre
+WAREHOUSE_TREE_USAGES = ('internal', 'view')
+
+# Modèles portant une copie stockée des champs de restriction, dans l'ordre de
+# reconstruction (une copie est remplie à partir de la précédente)
+RESTRICTION_COPY_MODELS = ('stock.quant', 'stock.move', 'stock.move.line', 'stock.picking')
 
 
 class StockLocation(models.Model):
@@ -8,12 +50,257 @@ class StockLocation(models.Model):
     # Champ pour lier les emplacements de transit à un entrepôt spécifique
     # Note: Ce champ est nommé transit_warehouse_id pour éviter un conflit avec le champ
     # warehouse_id calculé standard d'Odoo sur stock.location
+    # Index partiel (IS NOT NULL): filtré par presque tous les domaines de restriction,
+    # mais renseigné seulement sur les emplacements de transit
     transit_warehouse_id = fields.Many2one(
         'stock.warehouse',
         string='Entrepôt de Transit',
+        index='btree_not_null',
         help='Entrepôt associé à cet emplacement de transit. Obligatoire pour les emplacements de transit.'
     )
 
+    # Index trigramme: l'autocomplétion (ilike sur le nom complet) reste rapide
+    # quel que soit le nombre d'emplacements
+    complete_name = fields.Char(index='trigram')
+
+    # Entrepôt utilisé par les restrictions, stocké et indexé pour que tous les filtres
+    # se réduisent à une comparaison ('restriction_warehouse_id', 'in', ...)
+    restriction_warehouse_id = fields.Many2one(
+        'stock.warehouse',
+        string='Entrepôt de restriction',
+        compute='_compute_restriction_warehouse_id',
+        store=True,
+        index=True,
+        readonly=True,
+        help="Entrepôt auquel l'emplacement est rattaché pour les restrictions: "
+             "l'entrepôt de transit s'il est défini, sinon l'entrepôt dont la racine "
+             "contient l'emplacement (emplacements internes et virtuels)."
+    )
+
+    def init(self):
+        super().init()
+        # Emplacements de transit par entrepôt (_get_inter_transit_children_locations)
+        create_index(
+            self.env.cr, 'stock_location_transit_by_warehouse_idx', 'stock_location',
+            ['transit_warehouse_id', 'location_id'], where="usage IN ('transit', 'view') AND transit_warehouse_id IS NOT NULL",
+        )
+        restriction_cache.init_version_table(self.env.cr)
+
+    def _auto_init(self):
+        # Sur une base existante, créer la colonne et la remplir en SQL par lots
+        # plutôt que de laisser l'ORM recalculer tous les emplacements en une fois
+        if not column_exists(self.env.cr, 'stock_location', 'restriction_warehouse_id'):
+            create_column(self.env.cr, 'stock_location', 'restriction_warehouse_id', 'int4')
+            self._backfill_restriction_warehouse()
+        return super()._auto_init()
+
+    @api.model
+    def _classify_legacy_inter_transit_locations(self):
+        """
+        Assigne transit_warehouse_id aux anciens emplacements Inter-Transit qui n'étaient
+        reconnus que par leur nom complet ("Inter-Transit <entrepôt>").
+
+        Exécuté une fois (installation ou migration) en nombre constant de requêtes:
+        une recherche des candidats, une des entrepôts, puis une écriture par entrepôt.
+
+        Returns:
+            Nombre d'emplacements classés
+        """
+        candidates = self.with_context(bypass_location_security=True, active_test=False).search([
+            ('usage', 'in', ('view', 'transit')),
+            ('transit_warehouse_id', '=', False),
+            ('complete_name', 'ilike', 'Inter-Transit'),
+        ])
+        if not candidates:
+            return 0
+
+        # Les noms les plus longs d'abord: "Inter-Transit AB" ne doit pas être attribué à "A"
+        warehouses = self.env['stock.warehouse'].with_context(active_test=False).search([])
+        warehouses = warehouses.sorted(lambda w: len(w.name or ''), reverse=True)
+
+        locations_by_warehouse = {}
+        for location in candidates:
+            complete_name = location.complete_name or ''
+            warehouse = next(
+                (w for w in warehouses if f'Inter-Transit {w.name}' in complete_name), None
+            )
+            if warehouse:
+                locations_by_warehouse.setdefault(warehouse, self.browse())
+                locations_by_warehouse[warehouse] |= location
+
+        classified = 0
+        for warehouse, locations in locations_by_warehouse.items():
+            locations.write({'transit_warehouse_id': warehouse.id})
+            classified += len(locations)
+        _logger.info("%s emplacements Inter-Transit classés par nom", classified)
+        return classified
+
+    @api.model
+    def _get_restriction_warehouse_sql(self):
+        """
+        Expression SQL (alias `loc`) de l'entrepôt de restriction attendu,
+        équivalente à _compute_restriction_warehouse_id(). Paramètre nommé: usages.
+        """
+        # Lors de l'installation, transit_warehouse_id n'existe pas encore
+        if column_exists(self.env.cr, 'stock_location', 'transit_warehouse_id'):
+            transit_column = 'loc.transit_warehouse_id'
+        else:
+            transit_column = 'NULL::int4'
+        return """
+            COALESCE(%s, CASE WHEN loc.usage IN %%(usages)s THEN (
+                SELECT wh.id
+                  FROM stock_warehouse wh
+                  JOIN stock_location root ON root.id = wh.view_location_id
+                 WHERE loc.parent_path LIKE root.parent_path || '%%%%'
+              ORDER BY length(root.parent_path) DESC
+                 LIMIT 1
+            ) END)
+        """ % transit_column
+
+    @api.model
+    def _backfill_restriction_warehouse(self, batch_size=50000):
+        """
+        Remplit restriction_warehouse_id en SQL, par tranches d'IDs.
+
+        Args:
+            batch_size: Nombre d'IDs traités par requête UPDATE
+
+        Returns:
+            Nombre d'emplacements mis à jour
+        """
+        query = """
+            UPDATE stock_location loc
+               SET restriction_warehouse_id = %s
+             WHERE loc.id BETWEEN %%(start)s AND %%(stop)s
+        """ % self._get_restriction_warehouse_sql()
+        return _execute_in_batches(
+            self.env.cr, 'stock_location', query, {'usages': WAREHOUSE_TREE_USAGES}, batch_size
+        )
+
+    @api.model
+    def _rebuild_restriction_warehouse(self, batch_size=50000):
+        """
+        Reconstruit entièrement l'association emplacement → entrepôt de restriction,
+        puis les copies stockées sur les quants, mouvements, lignes de mouvement et
+        transferts (récupération après une modification faite hors ORM, import SQL, etc.).
+
+        Returns:
+            Dictionnaire {modèle: nombre d'enregistrements traités}
+        """
+        for model_name in ('stock.location',) + RESTRICTION_COPY_MODELS:
+            self.env[model_name].flush_model()
+        updated = {'stock.location': self._backfill_restriction_warehouse(batch_size=batch_size)}
+        for model_name in RESTRICTION_COPY_MODELS:
+            updated[model_name] = self.env[model_name]._backfill_restriction_fields(batch_size=batch_size)
+        self.env.invalidate_all()
+        self._invalidate_allowed_location_cache()
+        _logger.info("Champs de restriction reconstruits: %s", updated)
+        return updated
+
+    @api.model
+    def _check_restriction_warehouse_consistency(self):
+        """
+        Compare les champs de restriction stockés aux valeurs attendues: emplacements,
+        puis copies sur les quants, mouvements, lignes de mouvement et transferts.
+        Une requête par modèle.
+
+        Returns:
+            Dictionnaire {modèle: IDs incohérents}, vide si tout est à jour
+        """
+        for model_name in ('stock.location',) + RESTRICTION_COPY_MODELS:
+            self.env[model_name].flush_model()
+        self.env.cr.execute("""
+            SELECT loc.id
+              FROM stock_location loc
+             WHERE loc.restriction_warehouse_id IS DISTINCT FROM %s
+          ORDER BY loc.id
+        """ % self._get_restriction_warehouse_sql(), {'usages': WAREHOUSE_TREE_USAGES})
+        inconsistent = {'stock.location': [row[0] for row in self.env.cr.fetchall()]}
+        for model_name in RESTRICTION_COPY_MODELS:
+            inconsistent[model_name] = self.env[model_name]._check_restriction_fields_consistency()
+
+        inconsistent = {model_name: ids for model_name, ids in inconsistent.items() if ids}
+        for model_name, ids in inconsistent.items():
+            _logger.warning(
+                "%s enregistrements %s ont des champs de restriction incohérents (ex: %s)",
+                len(ids), model_name, ids[:20],
+            )
+        return inconsistent
+
+    @api.model
+    def _cron_check_restriction_columns(self):
+        """
+        Tâche planifiée: vérifie les champs de restriction stockés et les reconstruit
+        s'ils ont divergé (modification faite hors ORM, import SQL, etc.).
+
+        Ces colonnes sont partagées par tous les workers. Les caches de restriction
+        (restriction_cache) sont propres à chaque processus: ils ne sont pas préchargés
+        ici, chaque worker les remplit à la première utilisation.
+
+        Returns:
+            Dictionnaire {'inconsistent': {modèle: nb incohérents}, 'rebuilt': bool, 'duration': secondes}
+        """
+        start = time.perf_counter()
+        inconsistent = self._check_restriction_warehouse_consistency()
+        if inconsistent:
+            self._rebuild_restriction_warehouse()
+        counts = {model_name: len(ids) for model_name, ids in inconsistent.items()}
+        duration = time.perf_counter() - start
+        _logger.info("Champs de restriction vérifiés en %.2fs, incohérences: %s", duration, counts or 0)
+        return {'inconsistent': counts, 'rebuilt': bool(inconsistent), 'duration': duration}
+
+    @api.model
+    def _trigger_restriction_columns_check(self):
+        """Lance la vérification après l'installation ou la mise à jour, hors de sa transaction"""
+        cron = self.env.ref('restric_entrepot1.ir_cron_check_restriction_columns', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+
+    @api.depends('usage', 'transit_warehouse_id', 'location_id')
+    def _compute_restriction_warehouse_id(self):
+        """
+        L'entrepôt de transit est prioritaire. Sinon, pour les emplacements internes
+        et virtuels, on retient l'entrepôt dont la racine est l'ancêtre le plus proche.
+        """
+        warehouses = self.env['stock.warehouse'].sudo().with_context(active_test=False).search([
+            ('view_location_id', '!=', False)
+        ])
+        warehouse_by_root = {warehouse.view_location_id.id: warehouse.id for warehouse in warehouses}
+
+        for location in self:
+            warehouse_id = location.transit_warehouse_id.id
+            if not warehouse_id and location.usage in WAREHOUSE_TREE_USAGES:
+                # Ancêtres du plus proche au plus lointain (l'emplacement lui-même inclus)
+                parent_path = location.location_id.parent_path or ''
+                ancestor_ids = [location._origin.id] + [int(i) for i in reversed(parent_path.split('/')[:-1])]
+                warehouse_id = next(
+                    (warehouse_by_root[i] for i in ancestor_ids if i in warehouse_by_root), False
+                )
+            location.restriction_warehouse_id = warehouse_id
+
+    def _recompute_restriction_warehouse_subtree(self):
+        """
+        Marque les descendants à recalculer (déplacement dans l'arbre, racine d'entrepôt modifiée).
+
+        Les descendants sont lus par child_of (une requête sur parent_path, indexé),
+        sans charger l'index de l'arbre. add_to_compute() ne marque que
+        restriction_warehouse_id: modified() propage aux champs stockés qui en
+        dépendent (quants, mouvements, lignes de mouvement).
+        """
+        if not self:
+            return
+        Location = self.with_context(bypass_location_security=True, active_test=False)
+        descendants = Location.search([('id', 'child_of', self.ids)])
+        self.env.add_to_compute(self._fields['restriction_warehouse_id'], descendants)
+        descendants.modified(['restriction_warehouse_id'])
+
+    def _get_tree_changes(self):
+        """Modifications de l'index de l'arbre correspondant à l'état courant des emplacements"""
+        return [
+            ('upsert', location.id, location.location_id.id, location.usage, location.transit_warehouse_id.id)
+            for location in self
+        ]
+
     @api.constrains('usage', 'transit_warehouse_id')
     def _check_transit_warehouse(self):
         """Vérifie que les locations de transit ont un entrepôt assigné"""
@@ -28,11 +315,9 @@ class StockLocation(models.Model):
         """
         Construit un domaine de restrictions pour les emplacements d'un utilisateur.
 
-        Retourne un domaine qui autorise:
-        - Les emplacements internes sous la racine de chaque entrepôt
-        - Les emplacements de transit liés à chaque entrepôt via transit_warehouse_id
-        - Les emplacements virtuels (view) sous la racine de chaque entrepôt
-        - Les emplacements avec transit_warehouse_id assigné
+        Autorise les emplacements dont restriction_warehouse_id est l'un des entrepôts, soit:
+        - Les emplacements internes et virtuels (view) sous la racine d'un des entrepôts
+        - Les emplacements avec transit_warehouse_id assigné à un des entrepôts
 
         Args:
             warehouses: Recordset de stock.warehouse
@@ -43,40 +328,163 @@ class StockLocation(models.Model):
         if not warehouses:
             return [('id', '=', 0)]  # Refuse tous les emplacements
 
-        warehouse_ids = warehouses.ids
-        warehouse_conditions = []
-
-        # Construire une condition pour chaque entrepôt
-        for warehouse in warehouses:
-            if warehouse.view_location_id:
-                warehouse_condition = [
-                    '|',
-                    '&', ('usage', '=', 'internal'), ('id', 'child_of', warehouse.view_location_id.id),
-                    '|',
-                    '&', ('usage', '=', 'transit'), ('transit_warehouse_id', '=', warehouse.id),
-                    '&', ('usage', '=', 'view'), ('id', 'child_of', warehouse.view_location_id.id)
-                ]
-                warehouse_conditions.append(warehouse_condition)
-
-        # Combiner toutes les warehouse_conditions avec OR
-        if warehouse_conditions:
-            restriction_domain = warehouse_conditions[0]
-            for condition in warehouse_conditions[1:]:
-                restriction_domain = ['|'] + restriction_domain + condition
-
-            # Ajouter aussi les locations avec transit_warehouse_id assigné
-            warehouse_location_domain = [('transit_warehouse_id', 'in', warehouse_ids)]
-            restriction_domain = ['|'] + restriction_domain + warehouse_location_domain
-        else:
-            # Pas d'entrepôt avec view_location_id, mais on ajoute les locations par transit_warehouse_id
-            restriction_domain = [('transit_warehouse_id', 'in', warehouse_ids)]
+        return [('restriction_warehouse_id', 'in', warehouses.ids)]
+
+    @api.model
+    def _get_allowed_location_ids(self, warehouses):
+        """
+        Retourne les IDs des emplacements autorisés pour un ensemble d'entrepôts.
+
+        Une recherche indexée sur restriction_warehouse_id, non mise en cache: les
+        surcharges _search() comparent directement les colonnes de restriction et
+        n'ont pas besoin de cette liste.
+
+        Args:
+            warehouses: Recordset de stock.warehouse
+
+        Returns:
+            Tuple d'IDs de stock.location
+        """
+        if not warehouses:
+            return ()
+        Location = self.with_context(bypass_location_security=True, active_test=True)
+        return tuple(Location.search(self._get_allowed_location_domain(warehouses)).ids)
+
+    @api.model
+    def _get_location_tree_index(self):
+        """
+        Index en mémoire de l'arbre des emplacements (voir LocationTreeIndex).
+
+        Chargé en deux requêtes puis conservé dans les caches de restriction
+        (restriction_cache): partagé par le processus tant que la version des
+        données de restriction est inchangée. Une transaction qui modifie l'arbre
+        travaille sur une copie à laquelle ses modifications sont appliquées
+        (jamais partagée avant son commit), reportée sur la version suivante après
+        le commit.
+
+        Returns:
+            LocationTreeIndex
+        """
+        return restriction_cache.get_tree(self.env.cr, self._build_location_tree_index)
+
+    @api.model
+    def _build_location_tree_index(self):
+        """Charge l'arbre des emplacements et les racines d'entrepôts (deux requêtes)"""
+        cr = self.env.cr
+        self.flush_model(['location_id', 'usage', 'transit_warehouse_id'])
+        self.env['stock.warehouse'].flush_model(['view_location_id'])
+        cr.execute("SELECT id, location_id, usage, transit_warehouse_id FROM stock_location")
+        rows = cr.fetchall()
+        cr.execute("SELECT view_location_id, id FROM stock_warehouse WHERE view_location_id IS NOT NULL")
+        return LocationTreeIndex(rows, dict(cr.fetchall()))
+
+    @api.model
+    def _get_restriction_version(self):
+        """Version des données de restriction visible par la transaction (voir restriction_cache)"""
+        return restriction_cache.get_version(self.env.cr)
+
+    @api.model
+    def _get_scoped_warehouse_ids(self, warehouse_ids):
+        """
+        Réduit les entrepôts du profil à la portée `location_warehouse_scope` du contexte.
 
-        return restriction_domain
+        La vue du transfert transmet cette portée (quelques IDs d'entrepôts) au lieu de
+        la liste des emplacements autorisés: elle n'élargit jamais le profil.
+
+        Args:
+            warehouse_ids: Tuple des IDs d'entrepôts du profil de l'utilisateur
+
+        Returns:
+            Tuple des IDs d'entrepôts à appliquer
+        """
+        scope = self.env.context.get('location_warehouse_scope')
+        if not scope:
+            return warehouse_ids
+        scope = set(scope)
+        return tuple(warehouse_id for warehouse_id in warehouse_ids if warehouse_id in scope)
 
     @api.model
+    def _invalidate_allowed_location_cache(self, assignments=False, locations=False, tree_changes=()):
+        """
+        Invalide les caches de restriction: profils des utilisateurs et index de
+        l'arbre des emplacements.
+
+        Point unique d'invalidation, cohérent entre workers: la modification est
+        enregistrée dans la transaction (restriction_cache.mark_changed()), les autres
+        transactions voient la nouvelle version en même temps que les données. Seuls
+        les caches de ce module sont concernés.
+
+        Args:
+            assignments: True si les entrepôts effectifs des utilisateurs changent:
+                les domaines des règles d'accès (ir.rule), mis en cache par Odoo et
+                calculés à partir de restriction_warehouse_ids, sont aussi vidés
+            locations: True si seuls les emplacements ou entrepôts changent: les
+                profils des utilisateurs restent valides
+            tree_changes: Modifications à appliquer à l'index de l'arbre
+                (voir LocationTreeIndex.apply())
+        """
+        namespaces = () if locations else None
+        restriction_cache.mark_changed(self.env.cr, namespaces=namespaces, tree_changes=tree_changes)
+        if assignments:
+            self.env.registry.clear_cache()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        locations = super().create(vals_list)
+        # Un emplacement qui ne peut être rattaché à aucun entrepôt (clients, fournisseurs,
+        # rebut...) ne modifie aucun ensemble autorisé, quelle que soit sa position
+        tracked = locations.filtered(
+            lambda location: location.usage in WAREHOUSE_TREE_USAGES or location.transit_warehouse_id
+        )
+        if tracked:
+            self._invalidate_allowed_location_cache(locations=True, tree_changes=tracked._get_tree_changes())
+        return locations
+
+    def write(self, vals):
+        res = super().write(vals)
+        if any(field in vals for field in LOCATION_RESTRICTION_FIELDS):
+            tree_changes = ()
+            if any(field in vals for field in ('location_id', 'usage', 'transit_warehouse_id')):
+                tree_changes = self._get_tree_changes()
+            self._invalidate_allowed_location_cache(locations=True, tree_changes=tree_changes)
+        if 'location_id' in vals:
+            # Les descendants déplacés avec l'emplacement changent potentiellement d'entrepôt
+            self._recompute_restriction_warehouse_subtree()
+        return res
+
+    def unlink(self):
+        tree_changes = [('remove', location_id) for location_id in self.ids]
+        res = super().unlink()
+        self._invalidate_allowed_location_cache(locations=True, tree_changes=tree_changes)
+        return res
+
+    @api.model
+    @instrument_restriction
+    def _name_search(self, name, domain=None, operator='ilike', limit=None, order=None):
+        """
+        Chemin rapide de l'autocomplétion (many2one) pour les utilisateurs restreints.
+
+        La liste allowed_location_ids ou la portée location_warehouse_scope du contexte
+        sont remplacées par la seule comparaison indexée sur restriction_warehouse_id,
+        et _search() n'ajoute pas une seconde fois la restriction. La recherche sur le
+        nom utilise l'index trigramme de complete_name.
+        """
+        profile, warehouse_ids = self.env.user._get_restriction_profile()
+        if profile == PROFILE_UNRESTRICTED or self.env.context.get('bypass_location_security'):
+            return super()._name_search(name, domain=domain, operator=operator, limit=limit, order=order)
+
+        warehouses = self.env['stock.warehouse'].browse(self._get_scoped_warehouse_ids(warehouse_ids))
+        domain = expression.AND([domain or [], self._get_allowed_location_domain(warehouses)])
+        Location = self.with_context(
+            bypass_location_security=True, allowed_location_ids=False, location_warehouse_scope=False,
+        )
+        return super(StockLocation, Location)._name_search(name, domain=domain, operator=operator, limit=limit, order=order)
+
+    @api.model
+    @instrument_restriction
     def _search(self, args, offset=0, limit=None, order=None, **kwargs):
         """Surcharge de search pour filtrer les emplacements selon l'utilisateur"""
-        user = self.env.user
+        profile, warehouse_ids = self.env.user._get_restriction_profile()
         ctx_allowed = self.env.context.get('allowed_location_ids')
 
         def _is_internal_id_domain(domain):
@@ -98,27 +506,62 @@ class StockLocation(models.Model):
             # Si vous ne voulez que ctx_allowed, retournez ici.
 
         # Administrateurs et managers voient tout (sauf si ctx impose une liste ci-dessus)
-        if not (user.has_group('base.group_system') or user.has_group('stock.group_stock_manager')):
-            # Utilisateurs avec restriction d'entrepôt
-            if user.has_group('restric_entrepot1.group_entrepot_restric'):
-                # Eviter récursion sur les recherches internes
-                if _is_internal_id_domain(args) or self.env.context.get('bypass_location_security'):
-                    return super(StockLocation, self)._search(args, offset=offset, limit=limit, order=order, **kwargs)
-
-                warehouses = user.warehouse_ids
-                # Utiliser la méthode partagée pour construire le domaine de restrictions
-                restriction_domain = self._get_allowed_location_domain(warehouses)
-                args = args + restriction_domain if args else restriction_domain
+        # Utilisateurs avec restriction d'entrepôt
+        if profile != PROFILE_UNRESTRICTED:
+            # Eviter récursion sur les recherches internes
+            if _is_internal_id_domain(args) or self.env.context.get('bypass_location_security'):
+                return super(StockLocation, self)._search(args, offset=offset, limit=limit, order=order, **kwargs)
+
+            # Portée transmise par la vue du transfert (résolue sans requête: profil en cache)
+            warehouses = self.env['stock.warehouse'].browse(self._get_scoped_warehouse_ids(warehouse_ids))
+            # Utiliser la méthode partagée pour construire le domaine de restrictions
+            restriction_domain = self._get_allowed_location_domain(warehouses)
+            args = optimize_restriction_domain(self, args, restriction_domain)
+            if args is None:
+                # Restriction vide par construction: aucune requête
+                return self.browse()._as_query()
 
         return super(StockLocation, self)._search(args, offset=offset, limit=limit, order=order, **kwargs)
 
 
+class StockWarehouse(models.Model):
+    _inherit = 'stock.warehouse'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        warehouses = super().create(vals_list)
+        # Les emplacements de l'entrepôt sont créés avant l'entrepôt lui-même
+        warehouses._update_restriction_roots(self.env['stock.location'])
+        return warehouses
+
+    def write(self, vals):
+        old_roots = self.view_location_id if 'view_location_id' in vals else None
+        res = super().write(vals)
+        if 'view_location_id' in vals:
+            self._update_restriction_roots(old_roots)
+        return res
+
+    def _update_restriction_roots(self, old_roots):
+        """
+        Déclare les racines des entrepôts à l'index de l'arbre et recalcule l'entrepôt
+        de restriction des emplacements situés sous les anciennes et nouvelles racines.
+        """
+        tree_changes = [('root', root.id, False) for root in old_roots]
+        tree_changes += [
+            ('root', warehouse.view_location_id.id, warehouse.id)
+            for warehouse in self if warehouse.view_location_id
+        ]
+        self.env['stock.location']._invalidate_allowed_location_cache(locations=True, tree_changes=tree_changes)
+        (old_roots | self.view_location_id)._recompute_restriction_warehouse_subtree()
+
+
 class StockPickingType(models.Model):
     _inherit = 'stock.picking.type'
     # IMPORTANTE NOTE : Cette classe repose sur le fait que stock.picking.type a un champ 'warehouse_id'
     # qui lie chaque type d'opération à un entrepôt spécifique.
 
     @api.model
+    @instrument_restriction
     def _search(self, args, offset=0, limit=None, order=None, **kwargs):
         """
         Surcharge de search pour filtrer les types d'opération selon l'utilisateur.
@@ -136,23 +579,10 @@ class StockPickingType(models.Model):
         'warehouse_id' Many2one vers stock.warehouse. Si ce champ n'existe pas ou n'est pas correctement
         configuré, cette restriction ne fonctionnera pas.
         """
-        user = self.env.user
-
-        # Administrateurs et managers voient tout
-        if user.has_group('base.group_system') or user.has_group('stock.group_stock_manager'):
-            return super(StockPickingType, self)._search(args, offset=offset, limit=limit, order=order, **kwargs)
-
-        # Utilisateurs avec restriction d'entrepôt
-        if user.has_group('restric_entrepot1.group_entrepot_restric'):
-            warehouses = user.warehouse_ids
-            if warehouses:
-                # Filtrer les types d'opération pour ne montrer que ceux des entrepôts assignés
-                warehouse_ids = warehouses.ids
-                restriction_domain = [('warehouse_id', 'in', warehouse_ids)]
-                args = args + restriction_domain if args else restriction_domain
-            else:
-                # Pas d'entrepôt assigné = ne rien voir
-                args = args + [('id', '=', 0)] if args else [('id', '=', 0)]
+        # Types d'opération des entrepôts assignés
+        args = restrict_search_domain(self, args, lambda warehouse_ids: [('warehouse_id', 'in', warehouse_ids)])
+        if args is None:
+            return self.browse()._as_query()
 
         return super(StockPickingType, self)._search(args, offset=offset, limit=limit, order=order, **kwargs)
 
@@ -168,40 +598,87 @@ class StockPicking(models.Model):
         help="Indique si ce transfert a été créé automatiquement par une route Odoo. "
              "Les transferts créés par routes peuvent contourner certaines restrictions d'emplacements."
     )
+    # Entrepôt du type d'opération, stocké et indexé: le filtre et la règle d'accès
+    # des transferts comparent cette colonne au lieu de joindre stock_picking_type
+    restriction_warehouse_id = fields.Many2one(
+        'stock.warehouse',
+        string='Entrepôt de restriction',
+        related='picking_type_id.warehouse_id',
+        store=True,
+        index=True,
+    )
+
+    def _auto_init(self):
+        cr = self.env.cr
+        if not column_exists(cr, 'stock_picking', 'restriction_warehouse_id'):
+            create_column(cr, 'stock_picking', 'restriction_warehouse_id', 'int4')
+            self._backfill_restriction_fields()
+        return super()._auto_init()
 
     @api.model
-    def _search(self, args, offset=0, limit=None, order=None, **kwargs):
-        """Surcharge de search pour filtrer les opérations selon l'utilisateur"""
-        user = self.env.user
+    def _backfill_restriction_fields(self, batch_size=50000):
+        """Copie en SQL, par tranches d'IDs, l'entrepôt des types d'opération"""
+        query = """
+            UPDATE stock_picking picking
+               SET restriction_warehouse_id = picking_type.warehouse_id
+              FROM stock_picking_type picking_type
+             WHERE picking_type.id = picking.picking_type_id
+               AND picking.id BETWEEN %(start)s AND %(stop)s
+        """
+        return _execute_in_batches(self.env.cr, 'stock_picking', query, {}, batch_size)
 
-        # Administrateurs et managers voient tout
-        if user.has_group('base.group_system') or user.has_group('stock.group_stock_manager'):
-            return super(StockPicking, self)._search(args, offset=offset, limit=limit, order=order, **kwargs)
+    @api.model
+    def _check_restriction_fields_consistency(self):
+        """IDs des transferts dont l'entrepôt de restriction diffère de celui du type d'opération"""
+        self.env.cr.execute("""
+            SELECT picking.id
+              FROM stock_picking picking
+              JOIN stock_picking_type picking_type ON picking_type.id = picking.picking_type_id
+             WHERE picking.restriction_warehouse_id IS DISTINCT FROM picking_type.warehouse_id
+          ORDER BY picking.id
+        """)
+        return [row[0] for row in self.env.cr.fetchall()]
 
-        # Utilisateurs avec restriction d'entrepôt
-        if user.has_group('restric_entrepot1.group_entrepot_restric'):
-            warehouses = user.warehouse_ids
-            if warehouses:
-                # Filtrer les pickings pour ne montrer que ceux des entrepôts assignés
-                warehouse_ids = warehouses.ids
-                restriction_domain = [('picking_type_id.warehouse_id', 'in', warehouse_ids)]
-                args = args + restriction_domain if args else restriction_domain
-            else:
-                # Pas d'entrepôt assigné = ne rien voir
-                args = args + [('id', '=', 0)] if args else [('id', '=', 0)]
+    @api.model
+    @instrument_restriction
+    def _search(self, args, offset=0, limit=None, order=None, **kwargs):
+        """Surcharge de search pour filtrer les opérations selon l'utilisateur"""
+        # Colonne stockée et indexée, sans jointure sur le type d'opération
+        args = restrict_search_domain(
+            self, args, lambda warehouse_ids: [('restriction_warehouse_id', 'in', warehouse_ids)],
+        )
+        if args is None:
+            return self.browse()._as_query()
 
         return super(StockPicking, self)._search(args, offset=offset, limit=limit, order=order, **kwargs)
 
+    def init(self):
+        super().init()
+        # Index partiel pour la branche created_by_route de la règle d'accès des transferts:
+        # seuls les transferts créés par route y figurent
+        create_index(
+            self.env.cr, 'stock_picking_created_by_route_idx', 'stock_picking',
+            ['created_by_route'], where='created_by_route',
+        )
+
     # Champs techniques utilisés par la vue pour filtrer les emplacements affichés
     is_location_restricted = fields.Boolean(
         string='Restriction d\'emplacements active',
         compute='_compute_allowed_locations',
         store=False,
     )
+    allowed_warehouse_ids = fields.Many2many(
+        comodel_name='stock.warehouse',
+        string='Entrepôts autorisés',
+        compute='_compute_allowed_locations',
+        store=False,
+    )
+    # Liste complète des emplacements autorisés: plus utilisée par la vue (voir
+    # allowed_warehouse_ids), conservée pour les appels programmatiques
     allowed_location_ids = fields.Many2many(
         comodel_name='stock.location',
         string='Emplacements autorisés',
-        compute='_compute_allowed_locations',
+        compute='_compute_allowed_location_ids',
         store=False,
     )
 
@@ -209,10 +686,12 @@ class StockPicking(models.Model):
         """
         Vérifie si une location est autorisée pour l'utilisateur restreint.
 
-        Une location est autorisée si :
+        Une location est autorisée si son entrepôt de restriction est l'un des entrepôts, soit :
         1. Elle a un transit_warehouse_id assigné qui correspond à l'un des entrepôts
         2. Elle est interne ou virtuelle ET est un enfant de la racine d'un entrepôt
 
+        Pour plusieurs emplacements, appeler directement _get_disallowed_locations().
+
         Args:
             location: record stock.location
             warehouses: recordset stock.warehouse
@@ -222,164 +701,236 @@ class StockPicking(models.Model):
         """
         if not location or not warehouses:
             return False
-
-        warehouse_ids = warehouses.ids
-
-        # Cas 1: Location avec transit_warehouse_id assigné
-        if location.transit_warehouse_id and location.transit_warehouse_id.id in warehouse_ids:
-            return True
-
-        # Cas 2: Location interne ou virtuelle descendante de la racine d'un entrepôt
-        if location.usage in ('internal', 'view'):
-            for warehouse in warehouses:
-                if not warehouse.view_location_id:
-                    continue
-                # Vérifier si la location est enfant de la racine
-                if location.id in self.env['stock.location'].with_context(bypass_location_security=True).search([
-                    ('id', 'child_of', warehouse.view_location_id.id),
-                    ('id', '=', location.id),
-                ]).ids:
-                    return True
-
-        return False
+        return not self._get_disallowed_locations(location, warehouses)
 
     def _is_valid_inter_transit_location(self, location, warehouses):
         """
         Vérifie si une virtual location est un Inter-Transit valide pour les entrepôts
-        Vérifie d'abord le champ transit_warehouse_id, puis le pattern du nom en fallback
+        Se base uniquement sur transit_warehouse_id: les anciens emplacements reconnus
+        par leur nom sont classés une fois pour toutes par
+        stock.location._classify_legacy_inter_transit_locations()
         """
-        if location.usage != 'view':
-            return False
-
-        # Cas 1: Vérifier le champ transit_warehouse_id directement (approche robuste)
-        if location.transit_warehouse_id:
-            warehouse_ids = [w.id for w in warehouses]
-            return location.transit_warehouse_id.id in warehouse_ids
-
-        # Cas 2: Fallback - vérifier le pattern Inter-Transit dans le nom
-        complete_name = location.complete_name or ''
-        if 'Inter-Transit' not in complete_name:
+        if location.usage != 'view' or not location.transit_warehouse_id:
             return False
-
-        # Vérifier si le warehouse name correspond à l'un des entrepôts
-        for warehouse in warehouses:
-            expected_pattern = f'Inter-Transit {warehouse.name}'
-            if expected_pattern in complete_name:
-                return True
-
-        return False
+        return location.transit_warehouse_id.id in warehouses.ids
 
     def _get_inter_transit_children_locations(self, warehouses):
         """
         Récupère tous les enfants directs des virtual locations Inter-Transit
         qui ont un transit_warehouse_id correspondant aux entrepôts assignés
-        """
-        warehouse_ids = [w.id for w in warehouses]
 
-        # D'abord, chercher toutes les virtual locations Inter-Transit avec transit_warehouse_id
-        inter_transit_parents = self.env['stock.location'].with_context(bypass_location_security=True).search([
-            '&', ('usage', '=', 'view'),
-            ('transit_warehouse_id', 'in', warehouse_ids)
+        Une seule recherche (le parent est filtré par sous-requête), quel que soit
+        le nombre d'entrepôts ou de locations Inter-Transit.
+        """
+        warehouse_ids = warehouses.ids
+        return self.env['stock.location'].with_context(bypass_location_security=True).search([
+            ('transit_warehouse_id', 'in', warehouse_ids),
+            ('location_id.usage', '=', 'view'),
+            ('location_id.transit_warehouse_id', 'in', warehouse_ids),
         ])
 
-        # Puis, chercher tous les enfants directs de ces locations qui ont aussi transit_warehouse_id
-        children = self.env['stock.location']
-        for parent in inter_transit_parents:
-            parent_children = self.env['stock.location'].with_context(bypass_location_security=True).search([
-                '&', ('location_id', '=', parent.id),
-                ('transit_warehouse_id', 'in', warehouse_ids)
-            ])
-            children |= parent_children
-
-        return children
-
     @api.depends('picking_type_id')
+    @api.depends_context('uid')
+    @instrument_restriction
     def _compute_allowed_locations(self):
-        """Calcule la liste d'emplacements autorisés pour l'utilisateur courant.
+        """Calcule la portée des emplacements autorisés pour l'utilisateur courant.
         Utilisé par les domaines de `location_id` et `location_dest_id` dans la vue.
+
+        La portée est la liste des entrepôts du profil (quelques IDs), et non la liste
+        des emplacements autorisés (potentiellement des milliers): la vue filtre sur
+        restriction_warehouse_id et transmet la portée dans le contexte
+        (location_warehouse_scope), résolue par StockLocation._search() depuis le
+        profil en cache. Elle n'est renseignée que lorsqu'elle restreint réellement
+        la sélection (utilisateur restreint sur transfert interne).
         """
-        user = self.env.user
-        is_admin_or_manager = user.has_group('base.group_system') or user.has_group('stock.group_stock_manager')
-        is_restricted_user = user.has_group('restric_entrepot1.group_entrepot_restric') and not is_admin_or_manager
+        profile, warehouse_ids = self.env.user._get_restriction_profile()
+        is_restricted_user = profile != PROFILE_UNRESTRICTED
 
+        if is_restricted_user:
+            self.picking_type_id.fetch(['code'])
         for picking in self:
-            # reset
-            picking.is_location_restricted = False
-            picking.allowed_location_ids = [(5, 0, 0)]
-
-            # Cas 1: Admin/manager → tout voir
-            if is_admin_or_manager:
-                all_locs = self.env['stock.location'].with_context(bypass_location_security=True).search([])
-                picking.allowed_location_ids = [(6, 0, all_locs.ids)]
-                continue
-
-            # Cas 2: Non restreint ou pas un transfert interne → tout voir
+            # Cas 1 et 2: Admin/manager, non restreint ou pas un transfert interne → tout voir
             if (not is_restricted_user) or (not picking.picking_type_id) or (picking.picking_type_id.code != 'internal'):
-                all_locs = self.env['stock.location'].with_context(bypass_location_security=True).search([])
-                picking.allowed_location_ids = [(6, 0, all_locs.ids)]
+                picking.is_location_restricted = False
+                picking.allowed_warehouse_ids = [(5, 0, 0)]
                 continue
 
             # Cas 3: Utilisateur restreint sur transfert interne → seulement emplacements des entrepôts assignés
-            warehouses = user.warehouse_ids
-            if not warehouses:
-                # Pas d'entrepôt assigné = ne rien autoriser
+            # (aucun emplacement si aucun entrepôt assigné)
+            picking.allowed_warehouse_ids = [(6, 0, list(warehouse_ids))]
+            picking.is_location_restricted = True
+
+    @api.depends('picking_type_id')
+    @api.depends_context('uid')
+    def _compute_allowed_location_ids(self):
+        """Liste complète des emplacements autorisés (une recherche pour tous les transferts)"""
+        Location = self.env['stock.location']
+        allowed_ids = None
+        for picking in self:
+            if not picking.is_location_restricted:
                 picking.allowed_location_ids = [(5, 0, 0)]
-                picking.is_location_restricted = True
                 continue
+            if allowed_ids is None:
+                allowed_ids = list(Location._get_allowed_location_ids(picking.allowed_warehouse_ids))
+            picking.allowed_location_ids = [(6, 0, allowed_ids)]
 
-            # Collecter les emplacements autorisés en utilisant le domaine partagé
-            restriction_domain = self.env['stock.location']._get_allowed_location_domain(warehouses)
-            allowed = self.env['stock.location'].with_context(bypass_location_security=True).search(restriction_domain)
-            picking.allowed_location_ids = [(6, 0, allowed.ids)]
-            picking.is_location_restricted = True
+    def _get_disallowed_locations(self, locations, warehouses):
+        """
+        Retourne, parmi `locations`, les emplacements non autorisés pour les entrepôts.
 
+        L'appartenance est résolue par l'index en mémoire de l'arbre
+        (_get_location_tree_index(), même règle que restriction_warehouse_id),
+        sans requête une fois l'index chargé.
+
+        Args:
+            locations: recordset stock.location
+            warehouses: recordset stock.warehouse
+
+        Returns:
+            Recordset stock.location des emplacements refusés
+        """
+        index = self.env['stock.location']._get_location_tree_index()
+        warehouse_ids = set(warehouses.ids)
+        return locations.filtered(lambda location: index.warehouse_of(location.id) not in warehouse_ids)
 
     @api.constrains('location_dest_id', 'picking_type_id')
+    @instrument_restriction
     def _check_location_dest_allowed(self):
         """
         Vérifie que l'emplacement de destination est autorisé.
 
+        Tous les transferts sont validés en une passe et une seule ValidationError
+        liste l'ensemble des transferts refusés.
+
         Exception: Les transferts créés automatiquement par des routes Odoo
         (created_by_route=True) sont autorisés même si la destination n'est
         pas dans les entrepôts assignés de l'utilisateur.
         """
-        for picking in self:
-            # Ignorer pour les transferts automatiques
-            if self.env.context.get('skip_location_restriction'):
-                continue
+        # Ignorer pour les transferts automatiques
+        if self.env.context.get('skip_location_restriction'):
+            return
+
+        # Administrateurs, managers et utilisateurs hors restriction ne sont pas restreints
+        profile, warehouse_ids = self.env.user._get_restriction_profile()
+        if profile == PROFILE_UNRESTRICTED:
+            return
+
+        # Lecture groupée des champs utilisés: une requête par modèle pour tous les transferts
+        self.fetch(['created_by_route', 'picking_type_id', 'location_dest_id'])
+        self.picking_type_id.fetch(['code'])
+
+        # Seulement pour les transferts internes non créés par une route
+        pickings = self.filtered(
+            lambda p: not p.created_by_route and p.picking_type_id and p.picking_type_id.code == 'internal'
+        )
+        if not pickings:
+            return
 
-            # ✨ NOUVEAU: Bypasser la validation si créé par une route
-            if picking.created_by_route:
-                continue
+        warehouses = self.env['stock.warehouse'].browse(warehouse_ids)
+        if not warehouses:
+            raise ValidationError(
+                _("Vous devez avoir au moins un entrepôt assigné pour créer des transferts internes.")
+            )
+
+        disallowed = self._get_disallowed_locations(pickings.location_dest_id, warehouses)
+        if disallowed:
+            invalid_pickings = pickings.filtered(lambda p: p.location_dest_id in disallowed)
+            warehouse_names = ', '.join(warehouses.mapped('name'))
+            details = '\n'.join(
+                '- %s : %s' % (picking.display_name, picking.location_dest_id.complete_name)
+                for picking in invalid_pickings
+            )
+            raise ValidationError(
+                _("Les emplacements de destination suivants ne sont pas autorisés. Vous ne pouvez sélectionner que les emplacements de vos entrepôts: %s\n%s")
+                % (warehouse_names, details)
+            )
 
-            # Seulement pour les transferts internes
-            if not picking.picking_type_id or picking.picking_type_id.code != 'internal':
-                continue
+    @api.model
+    def preflight_location_restrictions(self, rows):
+        """
+        Valide un lot de transferts avant leur création (imports massifs).
 
-            user = self.env.user
+        Applique les règles de restriction (type d'opération des entrepôts assignés,
+        emplacements source et destination des transferts internes) à toutes les
+        lignes, sans rien créer. Le nombre de requêtes ne dépend pas du nombre de
+        lignes: une lecture des utilisateurs, une des types d'opération et une des
+        emplacements existants; l'appartenance des emplacements est résolue par
+        _get_disallowed_locations(), une fois par ensemble d'entrepôts.
 
-            # Administrateurs et managers ne sont pas restreints
-            if user.has_group('base.group_system') or user.has_group('stock.group_stock_manager'):
-                continue
+        Une ligne qui référence un type d'opération, un emplacement ou un utilisateur
+        inexistant reçoit un verdict invalide. Les messages citent les IDs reçus et
+        jamais les noms, lus en sudo, d'enregistrements d'autres entrepôts.
 
-            # Vérifier si l'utilisateur a une restriction
-            if user.has_group('restric_entrepot1.group_entrepot_restric'):
-                warehouses = user.warehouse_ids
-                if not warehouses:
-                    raise ValidationError(
-                        _("Vous devez avoir au moins un entrepôt assigné pour créer des transferts internes.")
-                    )
-
-                location_dest = picking.location_dest_id
-
-                # Vérifier si la destination est autorisée en utilisant la méthode partagée
-                if location_dest:
-                    if not picking._is_location_allowed(location_dest, warehouses):
-                        warehouse_names = ', '.join([w.name for w in warehouses])
-                        raise ValidationError(
-                            _("L'emplacement de destination '%s' n'est pas autorisé. Vous ne pouvez sélectionner que les emplacements de vos entrepôts: %s")
-                            % (location_dest.complete_name, warehouse_names)
-                        )
+        Args:
+            rows: Liste de dictionnaires avec les clés 'picking_type_id', 'location_id',
+                  'location_dest_id' et, optionnellement, 'user_id' (utilisateur courant
+                  par défaut)
+
+        Returns:
+            Liste alignée sur `rows` de dictionnaires {'valid': bool, 'message': str ou False}
+        """
+        if not rows:
+            return []
+        user_ids = {row.get('user_id') or self.env.uid for row in rows}
+        # Valider pour le compte d'un autre utilisateur est réservé aux gestionnaires de stock
+        if user_ids != {self.env.uid} and not self.env.user.has_group('stock.group_stock_manager'):
+            raise AccessError(_("Seul un gestionnaire de stock peut valider des transferts pour d'autres utilisateurs."))
+
+        users = self.env['res.users'].sudo().with_context(active_test=False).search([('id', 'in', list(user_ids))])
+        users.fetch(['warehouse_ids', 'warehouse_group_ids'])
+        profiles = {user.id: user._get_restriction_profile() for user in users}
+        picking_types = self.env['stock.picking.type'].sudo().with_context(active_test=False).search_fetch(
+            [('id', 'in', list({row.get('picking_type_id') for row in rows} - {False, None}))],
+            ['code', 'warehouse_id'],
+        )
+        picking_types_by_id = {picking_type.id: picking_type for picking_type in picking_types}
+        locations = self.env['stock.location'].sudo().with_context(
+            bypass_location_security=True, active_test=False,
+        ).search([('id', 'in', list({
+            location_id for row in rows
+            for location_id in (row.get('location_id'), row.get('location_dest_id'))
+        } - {False, None}))])
+        existing_location_ids = set(locations.ids)
+
+        disallowed_by_warehouses = {}
+
+        def _get_disallowed_ids(warehouse_ids):
+            if warehouse_ids not in disallowed_by_warehouses:
+                warehouses = self.env['stock.warehouse'].browse(warehouse_ids)
+                disallowed_by_warehouses[warehouse_ids] = set(self._get_disallowed_locations(locations, warehouses).ids)
+            return disallowed_by_warehouses[warehouse_ids]
+
+        verdicts = []
+        for row in rows:
+            user_id = row.get('user_id') or self.env.uid
+            picking_type = picking_types_by_id.get(row.get('picking_type_id'))
+            location_ids = [row.get(key) for key in ('location_id', 'location_dest_id') if row.get(key)]
+            unknown_location_ids = [
+                location_id for location_id in location_ids if location_id not in existing_location_ids
+            ]
+            message = False
+            if user_id not in profiles:
+                message = _("L'utilisateur %s n'existe pas.") % user_id
+            elif not picking_type:
+                message = _("Le type d'opération %s n'existe pas.") % (row.get('picking_type_id') or '')
+            elif unknown_location_ids:
+                message = _("L'emplacement %s n'existe pas.") % unknown_location_ids[0]
+            else:
+                profile, warehouse_ids = profiles[user_id]
+                if profile == PROFILE_UNRESTRICTED:
+                    pass
+                elif picking_type.warehouse_id.id not in warehouse_ids:
+                    message = _("Le type d'opération %s n'appartient pas à vos entrepôts.") % picking_type.id
+                elif picking_type.code == 'internal':
+                    if profile != PROFILE_RESTRICTED:
+                        message = _("Vous devez avoir au moins un entrepôt assigné pour créer des transferts internes.")
+                    else:
+                        disallowed_ids = _get_disallowed_ids(warehouse_ids)
+                        refused = [location_id for location_id in location_ids if location_id in disallowed_ids]
+                        if refused:
+                            message = _("L'emplacement %s n'est pas autorisé pour vos entrepôts.") % refused[0]
+            verdicts.append({'valid': not message, 'message': message})
+        return verdicts
 
     @api.onchange('picking_type_id')
     def _onchange_set_location_domains(self):
@@ -387,11 +938,15 @@ class StockPicking(models.Model):
         Ce retour de domaine s'applique même si d'autres vues héritées modifient
         les attributs de la vue.
         """
-        allowed_ids = self.allowed_location_ids.ids if self.allowed_location_ids else []
+        if not self.is_location_restricted:
+            # Aucune restriction: ne pas renvoyer la liste de tous les emplacements
+            return {'domain': {'location_id': [], 'location_dest_id': []}}
+        # Portée par entrepôt: quelques IDs au lieu de la liste des emplacements autorisés
+        domain = [('restriction_warehouse_id', 'in', self.allowed_warehouse_ids.ids)]
         return {
             'domain': {
-                'location_id': [('id', 'in', allowed_ids)],
-                'location_dest_id': [('id', 'in', allowed_ids)],
+                'location_id': domain,
+                'location_dest_id': domain,
             }
         }
 
@@ -413,29 +968,103 @@ class StockPicking(models.Model):
 
     def write(self, vals):
         """Valide le changement de location_id selon les restrictions"""
-        if 'location_id' in vals:
-            user = self.env.user
-            # Administrateurs et managers non restreints
-            if not (user.has_group('base.group_system') or user.has_group('stock.group_stock_manager')):
-                # Appliquer seulement aux utilisateurs restreints
-                if user.has_group('restric_entrepot1.group_entrepot_restric') and user.warehouse_ids:
-                    for picking in self:
-                        # Seulement pour transferts internes
-                        if picking.picking_type_id and picking.picking_type_id.code == 'internal':
-                            new_loc_id = vals['location_id']
-                            if new_loc_id:
-                                new_loc = self.env['stock.location'].with_context(bypass_location_security=True).browse(int(new_loc_id))
-                                # Utiliser la méthode partagée pour vérifier si la location est autorisée
-                                if not picking._is_location_allowed(new_loc, user.warehouse_ids):
-                                    warehouse_names = ', '.join([w.name for w in user.warehouse_ids])
-                                    raise ValidationError(_("L'emplacement source '%s' n'est pas autorisé. Vous ne pouvez utiliser que les emplacements de vos entrepôts: %s") % (new_loc.complete_name, warehouse_names))
+        if vals.get('location_id'):
+            profile, warehouse_ids = self.env.user._get_restriction_profile()
+            # Appliquer seulement aux utilisateurs restreints avec entrepôts, et seulement pour transferts internes.
+            # La nouvelle location est la même pour tous les transferts: une seule vérification.
+            if profile == PROFILE_RESTRICTED and 'internal' in self.picking_type_id.mapped('code'):
+                warehouses = self.env['stock.warehouse'].browse(warehouse_ids)
+                # browse() ne déclenche pas de recherche: inutile de changer de contexte
+                # (ce qui créerait un environnement distinct, sans prefetch commun)
+                new_loc = self.env['stock.location'].browse(int(vals['location_id']))
+                if self._get_disallowed_locations(new_loc, warehouses):
+                    warehouse_names = ', '.join(warehouses.mapped('name'))
+                    raise ValidationError(_("L'emplacement source '%s' n'est pas autorisé. Vous ne pouvez utiliser que les emplacements de vos entrepôts: %s") % (new_loc.complete_name, warehouse_names))
         return super().write(vals)
 
 
 class StockMove(models.Model):
     _inherit = 'stock.move'
 
+    # Champs de restriction stockés et indexés: les filtres et les règles d'accès
+    # comparent directement ces colonnes au lieu de joindre stock_location
+    restriction_location_warehouse_id = fields.Many2one(
+        'stock.warehouse',
+        string='Entrepôt de restriction (source)',
+        related='location_id.restriction_warehouse_id',
+        store=True,
+        index=True,
+    )
+    restriction_location_dest_warehouse_id = fields.Many2one(
+        'stock.warehouse',
+        string='Entrepôt de restriction (destination)',
+        related='location_dest_id.restriction_warehouse_id',
+        store=True,
+        index=True,
+    )
+    restriction_internal_flow = fields.Boolean(
+        string='Flux interne',
+        compute='_compute_restriction_internal_flow',
+        store=True,
+        help="Vrai si la source ou la destination est un emplacement interne ou virtuel "
+             "(ou si la source est vide). Utilisé par la règle d'accès des utilisateurs restreints."
+    )
+
+    def _auto_init(self):
+        # Sur une base existante, remplir les colonnes en SQL par lots plutôt que
+        # de laisser l'ORM recalculer tous les mouvements en une fois
+        cr = self.env.cr
+        if not column_exists(cr, 'stock_move', 'restriction_internal_flow') \
+                and column_exists(cr, 'stock_location', 'restriction_warehouse_id'):
+            create_column(cr, 'stock_move', 'restriction_location_warehouse_id', 'int4')
+            create_column(cr, 'stock_move', 'restriction_location_dest_warehouse_id', 'int4')
+            create_column(cr, 'stock_move', 'restriction_internal_flow', 'bool')
+            self._backfill_restriction_fields()
+        return super()._auto_init()
+
+    @api.model
+    def _backfill_restriction_fields(self, batch_size=50000):
+        """Remplit les champs de restriction des mouvements en SQL, par tranches d'IDs"""
+        query = """
+            UPDATE stock_move move
+               SET restriction_location_warehouse_id = src.restriction_warehouse_id,
+                   restriction_location_dest_warehouse_id = dest.restriction_warehouse_id,
+                   restriction_internal_flow = (src.usage IN %(usages)s OR dest.usage IN %(usages)s)
+              FROM stock_location src, stock_location dest
+             WHERE src.id = move.location_id
+               AND dest.id = move.location_dest_id
+               AND move.id BETWEEN %(start)s AND %(stop)s
+        """
+        return _execute_in_batches(
+            self.env.cr, 'stock_move', query, {'usages': WAREHOUSE_TREE_USAGES}, batch_size
+        )
+
+    @api.model
+    def _check_restriction_fields_consistency(self):
+        """IDs des mouvements dont les champs de restriction diffèrent de leurs emplacements"""
+        self.env.cr.execute("""
+            SELECT move.id
+              FROM stock_move move
+              JOIN stock_location src ON src.id = move.location_id
+              JOIN stock_location dest ON dest.id = move.location_dest_id
+             WHERE move.restriction_location_warehouse_id IS DISTINCT FROM src.restriction_warehouse_id
+                OR move.restriction_location_dest_warehouse_id IS DISTINCT FROM dest.restriction_warehouse_id
+                OR move.restriction_internal_flow IS DISTINCT FROM (src.usage IN %(usages)s OR dest.usage IN %(usages)s)
+          ORDER BY move.id
+        """, {'usages': WAREHOUSE_TREE_USAGES})
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.depends('location_id.usage', 'location_dest_id.usage')
+    def _compute_restriction_internal_flow(self):
+        for move in self:
+            move.restriction_internal_flow = (
+                not move.location_id
+                or move.location_id.usage in WAREHOUSE_TREE_USAGES
+                or move.location_dest_id.usage in WAREHOUSE_TREE_USAGES
+            )
+
     @api.model
+    @instrument_restriction
     def _search(self, args, offset=0, limit=None, order=None, **kwargs):
         """
         Surcharge de search pour filtrer les mouvements de stock selon l'utilisateur.
@@ -450,55 +1079,129 @@ class StockMove(models.Model):
 
         Voir StockQuant._search() pour la différence avec les quantités.
         """
-        user = self.env.user
+        # location_id OU location_dest_id rattachée à un entrepôt assigné: comparaison
+        # directe des colonnes stockées et indexées, sans jointure
+        args = restrict_search_domain(self, args, lambda warehouse_ids: [
+            '|',
+            ('restriction_location_warehouse_id', 'in', warehouse_ids),
+            ('restriction_location_dest_warehouse_id', 'in', warehouse_ids),
+        ])
+        if args is None:
+            return self.browse()._as_query()
 
-        # Administrateurs et managers voient tout
-        if user.has_group('base.group_system') or user.has_group('stock.group_stock_manager'):
-            return super(StockMove, self)._search(args, offset=offset, limit=limit, order=order, **kwargs)
+        return super(StockMove, self)._search(args, offset=offset, limit=limit, order=order, **kwargs)
 
-        # Utilisateurs avec restriction d'entrepôt
-        if user.has_group('restric_entrepot1.group_entrepot_restric'):
-            warehouses = user.warehouse_ids
-            if warehouses:
-                # Collecter toutes les locations autorisées pour les entrepôts assignés
-                allowed_location_ids = self.env['stock.location']
-
-                for warehouse in warehouses:
-                    # Locations avec transit_warehouse_id assigné directement
-                    warehouse_locations = self.env['stock.location'].with_context(bypass_location_security=True).search([
-                        ('transit_warehouse_id', '=', warehouse.id)
-                    ])
-                    allowed_location_ids |= warehouse_locations
-
-                    # Locations internes sous la racine de l'entrepôt
-                    if warehouse.view_location_id:
-                        internal_locations = self.env['stock.location'].with_context(bypass_location_security=True).search([
-                            ('usage', '=', 'internal'),
-                            ('id', 'child_of', warehouse.view_location_id.id)
-                        ])
-                        allowed_location_ids |= internal_locations
-
-                allowed_location_ids = allowed_location_ids.ids
-
-                # Domaine pour filtrer les mouvements:
-                # location_id OU location_dest_id dans les locations autorisées
-                restriction_domain = [
-                    '|',
-                    ('location_id', 'in', allowed_location_ids),
-                    ('location_dest_id', 'in', allowed_location_ids)
-                ]
-                args = args + restriction_domain if args else restriction_domain
-            else:
-                # Pas d'entrepôt assigné = ne rien voir
-                args = args + [('id', '=', 0)] if args else [('id', '=', 0)]
 
-        return super(StockMove, self)._search(args, offset=offset, limit=limit, order=order, **kwargs)
+class StockMoveLine(models.Model):
+    _inherit = 'stock.move.line'
+
+    # Copie stockée des champs de restriction du mouvement, pour la règle d'accès
+    restriction_location_warehouse_id = fields.Many2one(
+        'stock.warehouse',
+        string='Entrepôt de restriction (source)',
+        related='move_id.restriction_location_warehouse_id',
+        store=True,
+        index=True,
+    )
+    restriction_location_dest_warehouse_id = fields.Many2one(
+        'stock.warehouse',
+        string='Entrepôt de restriction (destination)',
+        related='move_id.restriction_location_dest_warehouse_id',
+        store=True,
+        index=True,
+    )
+    restriction_internal_flow = fields.Boolean(
+        string='Flux interne',
+        related='move_id.restriction_internal_flow',
+        store=True,
+    )
+
+    def _auto_init(self):
+        cr = self.env.cr
+        if not column_exists(cr, 'stock_move_line', 'restriction_internal_flow') \
+                and column_exists(cr, 'stock_move', 'restriction_internal_flow'):
+            create_column(cr, 'stock_move_line', 'restriction_location_warehouse_id', 'int4')
+            create_column(cr, 'stock_move_line', 'restriction_location_dest_warehouse_id', 'int4')
+            create_column(cr, 'stock_move_line', 'restriction_internal_flow', 'bool')
+            self._backfill_restriction_fields()
+        return super()._auto_init()
+
+    @api.model
+    def _backfill_restriction_fields(self, batch_size=50000):
+        """Copie en SQL, par tranches d'IDs, les champs de restriction des mouvements"""
+        query = """
+            UPDATE stock_move_line line
+               SET restriction_location_warehouse_id = move.restriction_location_warehouse_id,
+                   restriction_location_dest_warehouse_id = move.restriction_location_dest_warehouse_id,
+                   restriction_internal_flow = move.restriction_internal_flow
+              FROM stock_move move
+             WHERE move.id = line.move_id
+               AND line.id BETWEEN %(start)s AND %(stop)s
+        """
+        return _execute_in_batches(self.env.cr, 'stock_move_line', query, {}, batch_size)
+
+    @api.model
+    def _check_restriction_fields_consistency(self):
+        """IDs des lignes dont les champs de restriction diffèrent de leur mouvement"""
+        self.env.cr.execute("""
+            SELECT line.id
+              FROM stock_move_line line
+              JOIN stock_move move ON move.id = line.move_id
+             WHERE line.restriction_location_warehouse_id IS DISTINCT FROM move.restriction_location_warehouse_id
+                OR line.restriction_location_dest_warehouse_id IS DISTINCT FROM move.restriction_location_dest_warehouse_id
+                OR line.restriction_internal_flow IS DISTINCT FROM move.restriction_internal_flow
+          ORDER BY line.id
+        """)
+        return [row[0] for row in self.env.cr.fetchall()]
 
 
 class StockQuant(models.Model):
     _inherit = 'stock.quant'
 
+    # Entrepôt de restriction de l'emplacement, stocké et indexé sur le quant: les
+    # read_group des rapports et du pivot filtrent sans jointure ni sous-requête
+    restriction_warehouse_id = fields.Many2one(
+        'stock.warehouse',
+        string='Entrepôt de restriction',
+        related='location_id.restriction_warehouse_id',
+        store=True,
+        index=True,
+    )
+
+    def _auto_init(self):
+        cr = self.env.cr
+        if not column_exists(cr, 'stock_quant', 'restriction_warehouse_id') \
+                and column_exists(cr, 'stock_location', 'restriction_warehouse_id'):
+            create_column(cr, 'stock_quant', 'restriction_warehouse_id', 'int4')
+            self._backfill_restriction_fields()
+        return super()._auto_init()
+
+    @api.model
+    def _backfill_restriction_fields(self, batch_size=50000):
+        """Copie en SQL, par tranches d'IDs, l'entrepôt de restriction des emplacements"""
+        query = """
+            UPDATE stock_quant quant
+               SET restriction_warehouse_id = loc.restriction_warehouse_id
+              FROM stock_location loc
+             WHERE loc.id = quant.location_id
+               AND quant.id BETWEEN %(start)s AND %(stop)s
+        """
+        return _execute_in_batches(self.env.cr, 'stock_quant', query, {}, batch_size)
+
     @api.model
+    def _check_restriction_fields_consistency(self):
+        """IDs des quants dont l'entrepôt de restriction diffère de celui de l'emplacement"""
+        self.env.cr.execute("""
+            SELECT quant.id
+              FROM stock_quant quant
+              JOIN stock_location loc ON loc.id = quant.location_id
+             WHERE quant.restriction_warehouse_id IS DISTINCT FROM loc.restriction_warehouse_id
+          ORDER BY quant.id
+        """)
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    @instrument_restriction
     def _search(self, args, offset=0, limit=None, order=None, **kwargs):
         """
         Surcharge de search pour filtrer les quantités selon l'utilisateur et ses entrepôts assignés.
@@ -516,44 +1219,13 @@ class StockQuant(models.Model):
 
         Voir StockMove._search() pour la différence avec les mouvements.
         """
-        user = self.env.user
-
-        # Administrateurs et managers voient tout
-        if user.has_group('base.group_system') or user.has_group('stock.group_stock_manager'):
-            return super(StockQuant, self)._search(args, offset=offset, limit=limit, order=order, **kwargs)
-
-        # Utilisateurs avec restriction d'entrepôt
-        if user.has_group('restric_entrepot1.group_entrepot_restric'):
-            warehouses = user.warehouse_ids
-            if warehouses:
-                # Collecter toutes les locations autorisées pour les entrepôts assignés
-                allowed_location_ids = self.env['stock.location']
-
-                for warehouse in warehouses:
-                    # Locations avec transit_warehouse_id assigné directement
-                    warehouse_locations = self.env['stock.location'].with_context(bypass_location_security=True).search([
-                        ('transit_warehouse_id', '=', warehouse.id)
-                    ])
-                    allowed_location_ids |= warehouse_locations
-
-                    # Locations internes et view sous la racine de l'entrepôt
-                    if warehouse.view_location_id:
-                        internal_locations = self.env['stock.location'].with_context(bypass_location_security=True).search([
-                            '|',
-                            '&', ('usage', '=', 'internal'), ('id', 'child_of', warehouse.view_location_id.id),
-                            '&', ('usage', '=', 'view'), ('id', 'child_of', warehouse.view_location_id.id)
-                        ])
-                        allowed_location_ids |= internal_locations
-
-                allowed_location_ids = allowed_location_ids.ids
-
-                # Domaine pour filtrer les quantités: location_id doit être dans les locations autorisées
-                # Le filtrage par usage='internal' et warehouse_id suffit pour exclure les locations virtuelles
-                restriction_domain = [('location_id', 'in', allowed_location_ids)]
-                args = args + restriction_domain if args else restriction_domain
-            else:
-                # Pas d'entrepôt assigné = ne rien voir
-                args = args + [('id', '=', 0)] if args else [('id', '=', 0)]
+        # Emplacement rattaché à un entrepôt assigné: chaque read_group d'un rapport reçoit
+        # une comparaison sur une colonne indexée, sans requête supplémentaire
+        args = restrict_search_domain(
+            self, args, lambda warehouse_ids: [('restriction_warehouse_id', 'in', warehouse_ids)],
+        )
+        if args is None:
+            return self.browse()._as_query()
 
         return super(StockQuant, self)._search(args, offset=offset, limit=limit, order=order, **kwargs)
 
@@ -0,0 +1,42 @@
+from odoo import models, fields, api
+
+
+class StockWarehouseGroup(models.Model):
+    _name = 'stock.warehouse.group'
+    _description = "Groupe d'entrepôts"
+    _order = 'name'
+
+    # Un groupe (région, zone...) remplace l'affectation entrepôt par entrepôt:
+    # les entrepôts du groupe s'ajoutent aux entrepôts assignés des utilisateurs
+    name = fields.Char(string='Nom', required=True)
+    active = fields.Boolean(default=True)
+    warehouse_ids = fields.Many2many(
+        'stock.warehouse',
+        string='Entrepôts',
+        help="Entrepôts accessibles aux utilisateurs affectés à ce groupe"
+    )
+    user_ids = fields.Many2many(
+        'res.users',
+        'res_users_stock_warehouse_group_rel',
+        'group_id',
+        'user_id',
+        string='Utilisateurs',
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        groups = super().create(vals_list)
+        self.env['stock.location']._invalidate_allowed_location_cache(assignments=True)
+        return groups
+
+    def write(self, vals):
+        res = super().write(vals)
+        # Les entrepôts effectifs des utilisateurs du groupe changent
+        if any(field in vals for field in ('warehouse_ids', 'user_ids', 'active')):
+            self.env['stock.location']._invalidate_allowed_location_cache(assignments=True)
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['stock.location']._invalidate_allowed_location_cache(assignments=True)
+        return res
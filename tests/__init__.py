@@ -0,0 +1,18 @@
+from . import test_inter_transit
+from . import test_location_domain
+from . import test_location_name_search
+from . import test_location_tree_index
+from . import test_move_quant_search
+from . import test_move_restriction_fields
+from . import test_picking_form_scope
+from . import test_picking_validation
+from . import test_preflight
+from . import test_procurement_benchmark
+from . import test_restriction_benchmark
+from . import test_restriction_cache
+from . import test_restriction_cron
+from . import test_restriction_domain
+from . import test_restriction_indexes
+from . import test_restriction_instrumentation
+from . import test_restriction_rebuild
+from . import test_warehouse_groups
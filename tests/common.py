@@ -0,0 +1,177 @@
+import logging
+import time
+
+from odoo.tests import TransactionCase, new_test_user
+
+from odoo.addons.restric_entrepot1.models import restriction_cache
+
+_logger = logging.getLogger(__name__)
+
+RESTRICTED_GROUPS = 'stock.group_stock_user,restric_entrepot1.group_entrepot_restric'
+
+
+class RestrictionCase(TransactionCase):
+    """
+    Jeu de données commun: deux entrepôts et un utilisateur par profil de restriction
+    (gestionnaire sans restriction, restreint à l'entrepôt A, restreint sans entrepôt).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True))
+        Warehouse = cls.env['stock.warehouse']
+        cls.warehouse_a = Warehouse.create({'name': 'Restriction A', 'code': 'RSTA'})
+        cls.warehouse_b = Warehouse.create({'name': 'Restriction B', 'code': 'RSTB'})
+
+        cls.user_manager = new_test_user(
+            cls.env, login='restric_manager', groups='stock.group_stock_manager',
+        )
+        cls.user_restricted = new_test_user(cls.env, login='restric_user', groups=RESTRICTED_GROUPS)
+        cls.user_restricted.warehouse_ids = cls.warehouse_a
+        cls.user_no_warehouse = new_test_user(cls.env, login='restric_no_warehouse', groups=RESTRICTED_GROUPS)
+        cls.profile_users = {
+            'unrestricted': cls.user_manager,
+            'restricted': cls.user_restricted,
+            'no_warehouse': cls.user_no_warehouse,
+        }
+
+        cls.product = cls.env['product.product'].create({'name': 'Produit restriction', 'type': 'product'})
+        cls.Location = cls.env['stock.location'].with_context(bypass_location_security=True)
+
+    def setUp(self):
+        super().setUp()
+        # Les caches de restriction ne survivent pas au retour au point de sauvegarde
+        # qui termine chaque test: ils sont oubliés avant et après
+        restriction_cache.reset_transaction(self.cr)
+        self.addCleanup(restriction_cache.reset_transaction, self.cr)
+        self.addCleanup(restriction_cache.clear_shared, self.cr.dbname)
+
+    def create_picking(self, picking_type, location, location_dest, user=None, **vals):
+        """Transfert d'une unité de self.product, créé par `user` (superutilisateur par défaut)"""
+        Picking = self.env['stock.picking'].with_user(user) if user else self.env['stock.picking']
+        return Picking.create(dict({
+            'picking_type_id': picking_type.id,
+            'location_id': location.id,
+            'location_dest_id': location_dest.id,
+            'move_ids': [(0, 0, {
+                'name': self.product.name,
+                'product_id': self.product.id,
+                'product_uom': self.product.uom_id.id,
+                'product_uom_qty': 1,
+                'location_id': location.id,
+                'location_dest_id': location_dest.id,
+            })],
+        }, **vals))
+
+    def count_queries(self, func):
+        """
+        Exécute `func()` et retourne (nombre de requêtes, durée en ms, résultat).
+        Les écritures en attente sont validées avant et après, comme assertQueryCount().
+        """
+        self.env.flush_all()
+        count, start = self.cr.sql_log_count, time.perf_counter()
+        result = func()
+        self.env.flush_all()
+        return self.cr.sql_log_count - count, (time.perf_counter() - start) * 1000, result
+
+
+class RestrictionTopologyCase(RestrictionCase):
+    """
+    Topologie synthétique pour les mesures: entrepôts, arbres d'emplacements profonds,
+    emplacements de transit, puis quants, mouvements et transferts insérés en SQL.
+
+    Les tailles par défaut gardent une durée raisonnable. Pour une mesure réaliste
+    (1M de mouvements et de quants), les augmenter dans une sous-classe.
+    """
+
+    NB_WAREHOUSES = 20
+    TREE_DEPTH = 3
+    TREE_WIDTH = 5
+    NB_TRANSIT = 1000
+    NB_QUANTS = 100000
+    NB_MOVES = 100000
+    NB_PICKINGS = 10000
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        start = time.perf_counter()
+        cls.bench_warehouses = cls.env['stock.warehouse'].create([
+            {'name': 'Bench %s' % i, 'code': 'B%s' % i} for i in range(cls.NB_WAREHOUSES)
+        ])
+        cls.user_restricted.warehouse_ids |= cls.bench_warehouses[:cls.NB_WAREHOUSES // 2]
+        location_ids = []
+        for warehouse in cls.bench_warehouses:
+            level = warehouse.lot_stock_id
+            for depth in range(cls.TREE_DEPTH):
+                level = cls.Location.create([
+                    {'name': '%s-%s' % (depth, i), 'location_id': parent.id, 'usage': 'internal'}
+                    for parent in level for i in range(cls.TREE_WIDTH)
+                ])
+                location_ids += level.ids
+        virtual = cls.env.ref('stock.stock_location_locations_virtual')
+        cls.Location.create([
+            {
+                'name': 'Transit %s' % i,
+                'usage': 'transit',
+                'location_id': virtual.id,
+                'transit_warehouse_id': cls.bench_warehouses[i % cls.NB_WAREHOUSES].id,
+            }
+            for i in range(cls.NB_TRANSIT)
+        ])
+        cls.env.flush_all()
+        cls._insert_stock_data(location_ids)
+        _logger.info(
+            "Topologie de mesure: %s entrepôts, %s emplacements internes, %s transits, "
+            "%s quants, %s mouvements, %s transferts en %.1fs",
+            cls.NB_WAREHOUSES, len(location_ids), cls.NB_TRANSIT, cls.NB_QUANTS,
+            cls.NB_MOVES, cls.NB_PICKINGS, time.perf_counter() - start,
+        )
+
+    @classmethod
+    def _insert_stock_data(cls, location_ids):
+        """Quants, mouvements et transferts en SQL, puis copies des champs de restriction"""
+        cr = cls.env.cr
+        params = {
+            'locations': location_ids,
+            'nb': len(location_ids),
+            'product': cls.product.id,
+            'uom': cls.product.uom_id.id,
+            'company': cls.env.company.id,
+            'uid': cls.env.uid,
+            'picking_types': cls.bench_warehouses.int_type_id.ids,
+        }
+        cr.execute("""
+            INSERT INTO stock_quant (product_id, location_id, company_id, quantity, reserved_quantity,
+                                     in_date, create_uid, write_uid, create_date, write_date)
+            SELECT %(product)s, (%(locations)s::int[])[1 + serie %% %(nb)s], %(company)s, 1, 0,
+                   now() at time zone 'UTC', %(uid)s, %(uid)s, now() at time zone 'UTC', now() at time zone 'UTC'
+              FROM generate_series(1, %(count)s) AS serie
+        """, dict(params, count=cls.NB_QUANTS))
+        cr.execute("""
+            INSERT INTO stock_move (name, product_id, product_uom, product_uom_qty, location_id,
+                                    location_dest_id, company_id, procure_method, state, date,
+                                    create_uid, write_uid, create_date, write_date)
+            SELECT 'Mesure', %(product)s, %(uom)s, 1,
+                   (%(locations)s::int[])[1 + serie %% %(nb)s],
+                   (%(locations)s::int[])[1 + (serie * 7) %% %(nb)s],
+                   %(company)s, 'make_to_stock', 'done', now() at time zone 'UTC',
+                   %(uid)s, %(uid)s, now() at time zone 'UTC', now() at time zone 'UTC'
+              FROM generate_series(1, %(count)s) AS serie
+        """, dict(params, count=cls.NB_MOVES))
+        cr.execute("""
+            INSERT INTO stock_picking (name, picking_type_id, location_id, location_dest_id, move_type,
+                                       state, scheduled_date, date, company_id, priority,
+                                       create_uid, write_uid, create_date, write_date)
+            SELECT 'MESURE/' || serie, (%(picking_types)s::int[])[1 + serie %% array_length(%(picking_types)s::int[], 1)],
+                   (%(locations)s::int[])[1 + serie %% %(nb)s],
+                   (%(locations)s::int[])[1 + (serie * 3) %% %(nb)s],
+                   'direct', 'draft', now() at time zone 'UTC', now() at time zone 'UTC', %(company)s, '0',
+                   %(uid)s, %(uid)s, now() at time zone 'UTC', now() at time zone 'UTC'
+              FROM generate_series(1, %(count)s) AS serie
+        """, dict(params, count=cls.NB_PICKINGS))
+        for model_name in ('stock.quant', 'stock.move', 'stock.picking'):
+            cls.env[model_name]._backfill_restriction_fields()
+        cr.execute("ANALYZE stock_location, stock_quant, stock_move, stock_picking")
+        cls.env.invalidate_all()
@@ -0,0 +1,95 @@
+import os
+
+from odoo import release
+from odoo.modules.module import get_module_path
+from odoo.tests import tagged
+from odoo.tools import parse_version
+
+from .common import RestrictionCase
+
+
+@tagged('post_install', '-at_install')
+class TestInterTransit(RestrictionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # "Restriction AB" commence comme "Restriction A": le nom le plus long doit l'emporter
+        cls.warehouse_ab = cls.env['stock.warehouse'].create({'name': 'Restriction AB', 'code': 'RSAB'})
+        virtual = cls.env.ref('stock.stock_location_locations_virtual')
+        cls.views = {}
+        cls.transits = {}
+        for warehouse in (cls.warehouse_a, cls.warehouse_ab):
+            cls.views[warehouse] = view = cls.Location.create({
+                'name': 'Inter-Transit %s' % warehouse.name,
+                'usage': 'view',
+                'location_id': virtual.id,
+                'transit_warehouse_id': warehouse.id,
+            })
+            cls.transits[warehouse] = cls.Location.create({
+                'name': 'Quai',
+                'usage': 'transit',
+                'location_id': view.id,
+                'transit_warehouse_id': warehouse.id,
+            })
+        cls.unknown_view = cls.Location.create({
+            'name': 'Inter-Transit Entrepôt inconnu', 'usage': 'view', 'location_id': virtual.id,
+        })
+
+    def _make_legacy(self):
+        """Anciennes données: emplacements reconnus par leur seul nom, sans entrepôt de transit"""
+        locations = self.unknown_view
+        for warehouse in (self.warehouse_a, self.warehouse_ab):
+            locations |= self.views[warehouse] | self.transits[warehouse]
+        self.env.flush_all()
+        self.cr.execute(
+            "UPDATE stock_location SET transit_warehouse_id = NULL WHERE id IN %s", [tuple(locations.ids)],
+        )
+        locations.invalidate_recordset(['transit_warehouse_id'])
+
+    def test_classify_legacy_locations(self):
+        self._make_legacy()
+        classified = self.Location._classify_legacy_inter_transit_locations()
+        self.assertGreaterEqual(classified, 4)
+        for warehouse in (self.warehouse_a, self.warehouse_ab):
+            with self.subTest(warehouse=warehouse.name):
+                self.assertEqual(self.views[warehouse].transit_warehouse_id, warehouse)
+                self.assertEqual(self.transits[warehouse].transit_warehouse_id, warehouse)
+                self.assertEqual(self.transits[warehouse].restriction_warehouse_id, warehouse)
+        self.assertFalse(self.unknown_view.transit_warehouse_id)
+        # Une seconde exécution ne trouve plus rien à classer
+        self.assertEqual(self.Location._classify_legacy_inter_transit_locations(), 0)
+
+    def test_inter_transit_children(self):
+        Picking = self.env['stock.picking']
+        for warehouses in (self.warehouse_a, self.warehouse_a | self.warehouse_ab | self.warehouse_b):
+            expected = self.Location.browse()
+            for warehouse in warehouses & (self.warehouse_a | self.warehouse_ab):
+                expected |= self.transits[warehouse]
+            # Remplit les caches (profil, version) avant la mesure
+            Picking._get_inter_transit_children_locations(warehouses)
+            self.env.invalidate_all()
+            # Une seule recherche, quel que soit le nombre d'entrepôts
+            with self.assertQueryCount(1):
+                children = Picking._get_inter_transit_children_locations(warehouses)
+            self.assertEqual(children, expected)
+        self.assertFalse(Picking._get_inter_transit_children_locations(self.warehouse_b))
+
+        view_a = self.views[self.warehouse_a]
+        self.assertTrue(Picking._is_valid_inter_transit_location(view_a, self.warehouse_a))
+        self.assertFalse(Picking._is_valid_inter_transit_location(view_a, self.warehouse_ab))
+        self.assertFalse(Picking._is_valid_inter_transit_location(self.unknown_view, self.warehouse_a))
+
+    def test_migration_folders_use_full_versions(self):
+        """
+        Un dossier de migration à deux points est comparé tel quel à la version
+        installée (17.0.x.y.z): sans le préfixe de la série, il n'est jamais exécuté.
+        """
+        migrations_path = os.path.join(get_module_path('restric_entrepot1'), 'migrations')
+        installed = self.env['ir.module.module'].search([('name', '=', 'restric_entrepot1')]).latest_version
+        for folder in os.listdir(migrations_path):
+            if folder.startswith(('_', '.')):
+                continue
+            with self.subTest(folder=folder):
+                self.assertTrue(folder.startswith(release.major_version + '.'), folder)
+                self.assertLessEqual(parse_version(folder), parse_version(installed))
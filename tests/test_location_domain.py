@@ -0,0 +1,83 @@
+import logging
+
+from odoo.osv import expression
+from odoo.tests import tagged
+
+from .common import RestrictionCase, RestrictionTopologyCase
+
+_logger = logging.getLogger(__name__)
+
+
+def child_of_location_domain(warehouses):
+    """
+    Ancien domaine des emplacements autorisés, gardé comme référence des mesures:
+    deux branches child_of par entrepôt (internes et vues), plus les transits.
+    """
+    domain = [('transit_warehouse_id', 'in', warehouses.ids)]
+    for warehouse in warehouses:
+        for usage in ('internal', 'view'):
+            domain = expression.OR([domain, [
+                ('id', 'child_of', warehouse.view_location_id.id), ('usage', '=', usage),
+            ]])
+    return domain
+
+
+@tagged('post_install', '-at_install')
+class TestAllowedLocationDomain(RestrictionCase):
+
+    def test_same_locations_as_child_of(self):
+        transit = self.Location.create({
+            'name': 'Transit A',
+            'usage': 'transit',
+            'location_id': self.env.ref('stock.stock_location_locations_virtual').id,
+            'transit_warehouse_id': self.warehouse_a.id,
+        })
+        for warehouses in (self.warehouse_a, self.warehouse_b, self.warehouse_a | self.warehouse_b):
+            with self.subTest(warehouses=warehouses.mapped('code')):
+                domain = self.Location._get_allowed_location_domain(warehouses)
+                self.assertEqual(
+                    self.Location.search(domain), self.Location.search(child_of_location_domain(warehouses)),
+                )
+        self.assertIn(transit, self.Location.search(self.Location._get_allowed_location_domain(self.warehouse_a)))
+
+    def test_constant_domain_and_query_count(self):
+        """Une seule feuille et une seule requête, quel que soit le nombre d'entrepôts"""
+        for warehouses in (self.warehouse_a, self.warehouse_a | self.warehouse_b):
+            domain = self.Location._get_allowed_location_domain(warehouses)
+            self.assertEqual(len(domain), 1)
+            self.env.invalidate_all()
+            with self.assertQueryCount(1):
+                self.Location.search(domain)
+        with self.assertQueryCount(0):
+            self.assertEqual(self.Location._get_allowed_location_domain(self.env['stock.warehouse']), [('id', '=', 0)])
+
+
+@tagged('post_install', '-at_install', '-standard', 'restric_benchmark')
+class TestAllowedLocationDomainBenchmark(RestrictionTopologyCase):
+    """
+    Microbenchmark (--test-tags restric_benchmark): domaine restriction_warehouse_id
+    comparé à l'expansion child_of par entrepôt, pour un nombre croissant d'entrepôts.
+    """
+
+    def _measure(self, domain):
+        self.env.invalidate_all()
+        return self.count_queries(lambda: self.Location.search(domain).ids)
+
+    def test_benchmark_domain_builders(self):
+        for size in sorted({1, 5, self.NB_WAREHOUSES}):
+            warehouses = self.bench_warehouses[:size]
+            legacy_domain = child_of_location_domain(warehouses)
+            domain = self.Location._get_allowed_location_domain(warehouses)
+            # Premier passage: plans et pages en mémoire, hors mesure
+            self._measure(legacy_domain)
+            self._measure(domain)
+            legacy_count, legacy_ms, legacy_ids = self._measure(legacy_domain)
+            count, duration_ms, ids = self._measure(domain)
+
+            self.assertEqual(sorted(ids), sorted(legacy_ids))
+            self.assertEqual(count, 1, "Le domaine de restriction doit tenir en une requête")
+            _logger.info(
+                "%2s entrepôts, %6s emplacements | child_of: %3s feuilles %3s requêtes %8.1fms"
+                " | restriction_warehouse_id: %s feuille %s requête %8.1fms",
+                size, len(ids), len(legacy_domain), legacy_count, legacy_ms, len(domain), count, duration_ms,
+            )
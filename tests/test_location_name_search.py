@@ -0,0 +1,43 @@
+from odoo.tests import tagged
+
+from .common import RestrictionCase
+
+
+@tagged('post_install', '-at_install')
+class TestLocationNameSearch(RestrictionCase):
+    """Autocomplétion des emplacements (_name_search) pour un utilisateur restreint"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.extra_warehouses = cls.env['stock.warehouse'].create([
+            {'name': 'Autocomplétion %s' % i, 'code': 'RSN%s' % i} for i in range(5)
+        ])
+
+    def _name_search(self, name, **context):
+        Location = self.env['stock.location'].with_user(self.user_restricted).with_context(**context)
+        return Location.browse([location_id for location_id, _name in Location.name_search(name, limit=None)])
+
+    def test_only_allowed_locations(self):
+        locations = self._name_search('Stock')
+        self.assertIn(self.warehouse_a.lot_stock_id, locations)
+        self.assertNotIn(self.warehouse_b.lot_stock_id, locations)
+        self.assertEqual(locations.restriction_warehouse_id, self.warehouse_a)
+        self.assertFalse(self.env['stock.location'].with_user(self.user_no_warehouse).name_search('Stock'))
+
+        # Portée transmise par la vue du transfert: jamais d'élargissement du profil
+        scoped = self._name_search('Stock', location_warehouse_scope=self.warehouse_b.ids)
+        self.assertFalse(scoped)
+        scoped = self._name_search('Stock', location_warehouse_scope=self.warehouse_a.ids)
+        self.assertEqual(scoped, locations)
+
+    def test_query_count_independent_of_warehouses(self):
+        counts = {}
+        for nb_warehouses in (1, 3, 6):
+            self.user_restricted.warehouse_ids = (self.warehouse_a | self.extra_warehouses)[:nb_warehouses]
+            # Remplit les caches (profil, version, règles d'accès) avant la mesure
+            self._name_search('Stock')
+            self.env.invalidate_all()
+            counts[nb_warehouses], _duration, locations = self.count_queries(lambda: self._name_search('Stock'))
+            self.assertEqual(len(locations.restriction_warehouse_id), nb_warehouses)
+        self.assertEqual(len(set(counts.values())), 1, counts)
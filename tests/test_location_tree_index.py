@@ -0,0 +1,283 @@
+import logging
+import random
+import time
+
+from odoo.tests import TransactionCase, tagged
+
+from odoo.addons.restric_entrepot1.models import restriction_cache
+from odoo.addons.restric_entrepot1.models.location_tree_index import LocationTreeIndex
+
+_logger = logging.getLogger(__name__)
+
+
+def _synthetic_rows(nb_warehouses, depth, width):
+    """Arbre synthétique: une racine par entrepôt, `depth` niveaux de `width` enfants"""
+    rows, roots = [], {}
+    next_id = 1
+    for warehouse_id in range(1, nb_warehouses + 1):
+        root_id = next_id
+        next_id += 1
+        rows.append((root_id, None, 'view', None))
+        roots[root_id] = warehouse_id
+        level = [root_id]
+        for _depth in range(depth):
+            children = []
+            for parent_id in level:
+                for _i in range(width):
+                    rows.append((next_id, parent_id, 'internal', None))
+                    children.append(next_id)
+                    next_id += 1
+            level = children
+    return rows, roots
+
+
+def _alive_ids(index):
+    """IDs des emplacements présents dans l'index"""
+    return sorted(
+        location_id for location_id in set(index._base_parent) | set(index._changes) if location_id in index
+    )
+
+
+def _rebuilt(index):
+    """Index reconstruit à partir de l'état courant (référence des mises à jour incrémentales)"""
+    rows = [(location_id,) + index._node(location_id) for location_id in _alive_ids(index)]
+    return LocationTreeIndex(rows, index._warehouse_roots)
+
+
+class TestLocationTreeIndexCommon(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Location = cls.env['stock.location'].with_context(bypass_location_security=True)
+        cls.warehouse_a = cls.env['stock.warehouse'].create({'name': 'Index A', 'code': 'IDXA'})
+        cls.warehouse_b = cls.env['stock.warehouse'].create({'name': 'Index B', 'code': 'IDXB'})
+
+    def setUp(self):
+        super().setUp()
+        restriction_cache.reset_transaction(self.cr)
+        self.addCleanup(restriction_cache.reset_transaction, self.cr)
+        self.addCleanup(restriction_cache.clear_shared, self.cr.dbname)
+
+    def _create_subtree(self, parent, depth, width, prefix):
+        level = parent
+        created = self.Location.browse()
+        for depth_index in range(depth):
+            level = self.Location.create([
+                {'name': '%s-%s-%s' % (prefix, depth_index, i), 'location_id': node.id, 'usage': 'internal'}
+                for node in level for i in range(width)
+            ])
+            created |= level
+        return created
+
+    def assertIndexMatchesStoredField(self, index):
+        self.env.flush_all()
+        locations = self.Location.with_context(active_test=False).search([])
+        for location in locations:
+            self.assertEqual(
+                index.warehouse_of(location.id), location.restriction_warehouse_id.id,
+                "Entrepôt de restriction différent pour %s" % location.complete_name,
+            )
+
+
+@tagged('post_install', '-at_install')
+class TestLocationTreeIndex(TestLocationTreeIndexCommon):
+
+    def test_incremental_changes_match_stored_field(self):
+        """Les modifications de la transaction sont appliquées à une copie de l'index partagé"""
+        base = self.Location._get_location_tree_index()
+        self.assertIsNot(base.copy(), base)
+
+        subtree = self._create_subtree(self.warehouse_a.lot_stock_id, 2, 3, 'incr')
+        transit = self.Location.create({
+            'name': 'Transit B', 'usage': 'transit', 'transit_warehouse_id': self.warehouse_b.id,
+            'location_id': self.env.ref('stock.stock_location_locations_virtual').id,
+        })
+        # Déplacement d'un sous-arbre vers l'autre entrepôt
+        subtree[0].location_id = self.warehouse_b.lot_stock_id
+
+        index = self.Location._get_location_tree_index()
+        self.assertIsNot(index, base, "La transaction doit travailler sur une copie privée")
+        self.assertEqual(index.warehouse_of(transit.id), self.warehouse_b.id)
+        self.assertEqual(index.warehouse_of(subtree[0].id), self.warehouse_b.id)
+        self.assertIndexMatchesStoredField(index)
+
+    def test_subtree_recompute(self):
+        """Déplacer un emplacement recalcule ses descendants, y compris ceux créés dans la transaction"""
+        self.Location._get_location_tree_index()
+        subtree = self._create_subtree(self.warehouse_a.lot_stock_id, 3, 2, 'move')
+        descendants = subtree.filtered(lambda location: location.parent_path.startswith(subtree[0].parent_path))
+
+        subtree[0].location_id = self.warehouse_b.lot_stock_id
+        self.env.flush_all()
+        self.assertEqual(descendants.restriction_warehouse_id, self.warehouse_b)
+
+    def test_unknown_parent_reloads_index(self):
+        """
+        Un emplacement client n'est pas suivi par l'index: y rattacher un enfant
+        interne provoque le rechargement de l'index au lieu d'une réponse fausse.
+        """
+        self.Location._get_location_tree_index()
+        customer = self.Location.create({
+            'name': 'Client interne', 'usage': 'customer',
+            'location_id': self.warehouse_a.view_location_id.id,
+        })
+        child = self.Location.create({'name': 'Sous-client', 'usage': 'internal', 'location_id': customer.id})
+
+        index = self.Location._get_location_tree_index()
+        self.assertEqual(index.warehouse_of(child.id), self.warehouse_a.id)
+        self.assertIndexMatchesStoredField(index)
+
+    def test_nested_warehouse_roots(self):
+        self.Location._get_location_tree_index()
+        self.warehouse_b.view_location_id.location_id = self.warehouse_a.view_location_id
+        index = self.Location._get_location_tree_index()
+        # La racine la plus proche l'emporte: les emplacements de B restent à B
+        self.assertEqual(index.warehouse_of(self.warehouse_b.lot_stock_id.id), self.warehouse_b.id)
+        self.assertIndexMatchesStoredField(index)
+
+    def test_disallowed_locations_without_queries(self):
+        Picking = self.env['stock.picking']
+        index = self.Location._get_location_tree_index()
+        locations = self.warehouse_a.lot_stock_id | self.warehouse_b.lot_stock_id
+        with self.assertQueryCount(0):
+            disallowed = Picking._get_disallowed_locations(locations, self.warehouse_a)
+        self.assertEqual(disallowed, self.warehouse_b.lot_stock_id)
+        self.assertTrue(index.is_descendant(self.warehouse_a.lot_stock_id.id, self.warehouse_a.view_location_id.id))
+
+    def test_move_does_not_load_index(self):
+        """Le recalcul des descendants lit parent_path: aucun chargement de l'index"""
+        subtree = self._create_subtree(self.warehouse_a.lot_stock_id, 2, 2, 'noload')
+        self.env.flush_all()
+        restriction_cache.reset_transaction(self.cr)
+        restriction_cache.clear_shared(self.cr.dbname)
+        subtree[0].location_id = self.warehouse_b.lot_stock_id
+        self.env.flush_all()
+        self.assertNotIn(restriction_cache.TREE, restriction_cache.get_store(self.cr))
+        self.assertEqual(subtree[0].restriction_warehouse_id, self.warehouse_b)
+
+    def test_incremental_changes_match_rebuild(self):
+        """Après toute suite de modifications, l'index répond comme un index reconstruit"""
+        rng = random.Random(0)
+        for _trial in range(10):
+            rows, roots = _synthetic_rows(nb_warehouses=3, depth=3, width=3)
+            index = LocationTreeIndex(rows, roots)
+            next_id = rows[-1][0] + 1
+            for _step in range(40):
+                alive = _alive_ids(index)
+                operation = rng.random()
+                if operation < 0.4:
+                    location_id, parent_id = rng.choice(alive), rng.choice(alive)
+                    if index.is_descendant(parent_id, location_id):
+                        continue
+                    change = ('upsert', location_id, parent_id, rng.choice(['internal', 'view', 'customer']), None)
+                elif operation < 0.6:
+                    change = ('upsert', next_id, rng.choice(alive), 'internal', None)
+                    next_id += 1
+                elif operation < 0.8:
+                    change = ('root', rng.choice(alive), rng.choice([False, 101, 102]))
+                else:
+                    change = ('remove', rng.choice(alive))
+                self.assertTrue(index.apply([change]))
+                if rng.random() < 0.1:
+                    index.prepare()
+
+                reference = _rebuilt(index)
+                alive = _alive_ids(index)
+                self.assertEqual(len(index), len(alive))
+                for location_id in alive:
+                    self.assertEqual(index.warehouse_of(location_id), reference.warehouse_of(location_id))
+                for ancestor_id in rng.sample(alive, 5):
+                    self.assertEqual(
+                        sorted(index.descendant_ids(ancestor_id)), sorted(reference.descendant_ids(ancestor_id)),
+                    )
+
+    def test_apply_unknown_location(self):
+        index = LocationTreeIndex([(1, None, 'view', None), (2, 1, 'internal', None)], {1: 10})
+        self.assertTrue(index.apply([('upsert', 3, 2, 'internal', None)]))
+        self.assertEqual(index.warehouse_of(3), 10)
+        self.assertFalse(index.apply([('upsert', 5, 4, 'internal', None)]))
+        self.assertFalse(index.apply([('root', 4, 11)]))
+
+
+@tagged('post_install', '-at_install', '-standard', 'restric_benchmark')
+class TestLocationTreeIndexBenchmark(TestLocationTreeIndexCommon):
+    """
+    Mesures de l'index de l'arbre (à lancer explicitement: --test-tags restric_benchmark).
+    Les résultats sont écrits dans les logs.
+    """
+
+    def test_benchmark_synthetic_tree(self):
+        # 70 entrepôts, 4 niveaux de 9 enfants: 516 670 emplacements
+        rows, roots = _synthetic_rows(nb_warehouses=70, depth=4, width=9)
+        self.assertGreaterEqual(len(rows), 500000)
+        start = time.perf_counter()
+        index = LocationTreeIndex(rows, roots)
+        build = time.perf_counter() - start
+
+        rng = random.Random(0)
+        sample = [rng.choice(rows)[0] for _i in range(100000)]
+        start = time.perf_counter()
+        for location_id in sample:
+            index.warehouse_of(location_id)
+        warehouse_of = (time.perf_counter() - start) / len(sample)
+
+        # Déplacements successifs, chacun suivi d'une question et du report après
+        # commit (copie, modification, prepare()), comme une transaction par déplacement
+        nb_moves = 100
+        internal_ids = [row[0] for row in rows if row[2] == 'internal' and row[1] not in roots]
+        moves = [(rng.choice(internal_ids), rng.choice(list(roots))) for _i in range(nb_moves)]
+        start = time.perf_counter()
+        for location_id, new_parent_id in moves:
+            index = index.copy()
+            self.assertTrue(index.apply([('upsert', location_id, new_parent_id, 'internal', None)]))
+            self.assertEqual(index.warehouse_of(location_id), roots[new_parent_id])
+            index.prepare()
+        move_and_query = (time.perf_counter() - start) / nb_moves
+        self.assertLess(move_and_query, build / 10, "Un déplacement ne doit pas renuméroter l'arbre")
+
+        start = time.perf_counter()
+        for location_id in sample[:10000]:
+            index.warehouse_of(location_id)
+        warehouse_of_after_moves = (time.perf_counter() - start) / 10000
+
+        _logger.info(
+            "Index de l'arbre: %s emplacements, construction %.0fms, warehouse_of %.2fµs "
+            "(%.2fµs après %s déplacements), déplacement suivi d'une question et du report %.2fms",
+            len(index), build * 1000, warehouse_of * 1e6, warehouse_of_after_moves * 1e6,
+            nb_moves, move_and_query * 1000,
+        )
+
+    def test_benchmark_against_database(self):
+        """Descendants et entrepôt de restriction: index contre requêtes (child_of, lecture)"""
+        subtree = self._create_subtree(self.warehouse_a.lot_stock_id, 3, 8, 'bench')
+        self.env.flush_all()
+        restriction_cache.reset_transaction(self.cr)
+        roots = subtree[:8]
+        index = self.Location._get_location_tree_index()
+
+        self.env.invalidate_all()
+        count, start = self.cr.sql_log_count, time.perf_counter()
+        for root in roots:
+            self.Location.search([('id', 'child_of', root.id)])
+        db_descendants = (self.cr.sql_log_count - count, time.perf_counter() - start)
+        start = time.perf_counter()
+        for root in roots:
+            index.descendant_ids(root.id)
+        index_descendants = time.perf_counter() - start
+
+        self.env.invalidate_all()
+        count, start = self.cr.sql_log_count, time.perf_counter()
+        subtree.fetch(['restriction_warehouse_id'])
+        db_warehouse = (self.cr.sql_log_count - count, time.perf_counter() - start)
+        start = time.perf_counter()
+        for location_id in subtree.ids:
+            index.warehouse_of(location_id)
+        index_warehouse = time.perf_counter() - start
+
+        _logger.info(
+            "%s emplacements: descendants %s requêtes %.1fms / index %.1fms, "
+            "entrepôt de restriction %s requêtes %.1fms / index %.1fms",
+            len(subtree), db_descendants[0], db_descendants[1] * 1000, index_descendants * 1000,
+            db_warehouse[0], db_warehouse[1] * 1000, index_warehouse * 1000,
+        )
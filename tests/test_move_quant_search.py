@@ -0,0 +1,124 @@
+import logging
+
+from odoo.tests import tagged
+
+from .common import RestrictionCase, RestrictionTopologyCase
+
+_logger = logging.getLogger(__name__)
+
+
+def location_list_domains(allowed_ids):
+    """
+    Anciens filtres des mouvements et des quants, gardés comme référence des mesures:
+    liste des emplacements autorisés envoyée telle quelle à PostgreSQL.
+    """
+    allowed_ids = list(allowed_ids)
+    return {
+        'stock.move': ['|', ('location_id', 'in', allowed_ids), ('location_dest_id', 'in', allowed_ids)],
+        'stock.quant': [('location_id', 'in', allowed_ids)],
+    }
+
+
+def restriction_column_domains(warehouse_ids):
+    """Filtres des surcharges _search(): colonnes de restriction stockées et indexées"""
+    warehouse_ids = list(warehouse_ids)
+    return {
+        'stock.move': [
+            '|',
+            ('restriction_location_warehouse_id', 'in', warehouse_ids),
+            ('restriction_location_dest_warehouse_id', 'in', warehouse_ids),
+        ],
+        'stock.quant': [('restriction_warehouse_id', 'in', warehouse_ids)],
+    }
+
+
+@tagged('post_install', '-at_install')
+class TestMoveQuantSearch(RestrictionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.shelves = cls.Location.create([
+            {'name': 'Étagère %s' % i, 'location_id': cls.warehouse_a.lot_stock_id.id, 'usage': 'internal'}
+            for i in range(20)
+        ])
+        for location in (cls.shelves[0], cls.warehouse_b.lot_stock_id):
+            cls.env['stock.quant']._update_available_quantity(cls.product, location, 5)
+
+    def test_same_records_as_location_list(self):
+        picking_a = self.create_picking(
+            self.warehouse_a.int_type_id, self.warehouse_a.lot_stock_id, self.shelves[1],
+        )
+        picking_b = self.create_picking(
+            self.warehouse_b.int_type_id, self.warehouse_b.lot_stock_id, self.warehouse_b.lot_stock_id,
+        )
+        warehouses = self.warehouse_a
+        allowed_ids = self.Location._get_allowed_location_ids(warehouses)
+        legacy = location_list_domains(allowed_ids)
+        domains = restriction_column_domains(warehouses.ids)
+        for model_name in ('stock.move', 'stock.quant'):
+            with self.subTest(model=model_name):
+                Model = self.env[model_name]
+                self.assertEqual(Model.search(domains[model_name]), Model.search(legacy[model_name]))
+
+        Move = self.env['stock.move'].with_user(self.user_restricted)
+        self.assertIn(picking_a.move_ids, Move.search([]))
+        self.assertNotIn(picking_b.move_ids, Move.search([]))
+        quants = self.env['stock.quant'].with_user(self.user_restricted).search([])
+        self.assertEqual(quants.location_id, self.shelves[0])
+
+    def test_no_location_list_in_query(self):
+        """Une requête, sans la liste des emplacements autorisés dans ses paramètres"""
+        allowed_ids = set(self.Location._get_allowed_location_ids(self.warehouse_a))
+        self.assertGreater(len(allowed_ids), len(self.user_restricted.warehouse_ids))
+        for model_name in ('stock.move', 'stock.quant'):
+            Model = self.env[model_name].with_user(self.user_restricted)
+            Model.search_count([])
+            with self.subTest(model=model_name):
+                with self.assertQueryCount(1):
+                    Model.search_count([])
+                params = Model._search([]).select().params
+                for param in params:
+                    if isinstance(param, (tuple, list)):
+                        self.assertFalse(allowed_ids <= set(param))
+
+
+@tagged('post_install', '-at_install', '-standard', 'restric_benchmark')
+class TestMoveQuantSearchBenchmark(RestrictionTopologyCase):
+    """
+    Mesures avant/après (--test-tags restric_benchmark): liste des emplacements
+    autorisés comparée aux colonnes de restriction, sur la topologie synthétique.
+    """
+
+    def _measure(self, Model, domain):
+        self.env.invalidate_all()
+        return self.count_queries(lambda: Model.search_count(domain))
+
+    def test_benchmark_move_quant_search(self):
+        warehouse_ids = self.user_restricted._get_restriction_profile()[1]
+        warehouses = self.env['stock.warehouse'].browse(warehouse_ids)
+        # Avant: les emplacements autorisés étaient lus puis envoyés en liste
+        list_count, list_ms, allowed_ids = self.count_queries(
+            lambda: self.Location._get_allowed_location_ids(warehouses)
+        )
+        legacy = location_list_domains(allowed_ids)
+        domains = restriction_column_domains(warehouses.ids)
+        for model_name in ('stock.move', 'stock.quant'):
+            Model = self.env[model_name]
+            # Premier passage: plans et pages en mémoire, hors mesure
+            self._measure(Model, legacy[model_name])
+            self._measure(Model, domains[model_name])
+            before = self._measure(Model, legacy[model_name])
+            after = self._measure(Model, domains[model_name])
+            self.assertEqual(before[2], after[2])
+
+            UserModel = Model.with_user(self.user_restricted)
+            self._measure(UserModel, [])
+            user_count, user_ms, _total = self._measure(UserModel, [])
+            self.assertEqual(user_count, 1)
+            _logger.info(
+                "%-11s %7s lignes | avant (%s emplacements): %s+%s requêtes %8.1fms"
+                " | après: %s requête %8.1fms | utilisateur restreint: %s requête %8.1fms",
+                model_name, after[2], len(allowed_ids), list_count, before[0], list_ms + before[1],
+                after[0], after[1], user_count, user_ms,
+            )
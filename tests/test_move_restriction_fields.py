@@ -0,0 +1,116 @@
+from odoo.exceptions import AccessError
+from odoo.tests import tagged
+
+from .common import RestrictionCase
+
+
+@tagged('post_install', '-at_install')
+class TestMoveRestrictionFields(RestrictionCase):
+    """Colonnes de restriction stockées des mouvements, copies des lignes et règles d'accès"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Consommable: les lignes créées ne réservent pas de stock
+        cls.consumable = cls.env['product.product'].create({'name': 'Consommable restriction', 'type': 'consu'})
+        cls.customers = cls.env.ref('stock.stock_location_customers')
+        virtual = cls.env.ref('stock.stock_location_locations_virtual')
+        cls.transit_a, cls.transit_b = cls.Location.create([
+            {
+                'name': 'Transit %s' % warehouse.code,
+                'usage': 'transit',
+                'location_id': virtual.id,
+                'transit_warehouse_id': warehouse.id,
+            }
+            for warehouse in (cls.warehouse_a, cls.warehouse_b)
+        ])
+
+    def _create_move(self, location, location_dest):
+        """Mouvement et sa ligne, créés en superutilisateur"""
+        move = self.env['stock.move'].create({
+            'name': self.consumable.name,
+            'product_id': self.consumable.id,
+            'product_uom': self.consumable.uom_id.id,
+            'product_uom_qty': 1,
+            'location_id': location.id,
+            'location_dest_id': location_dest.id,
+        })
+        self.env['stock.move.line'].create({
+            'move_id': move.id,
+            'product_id': self.consumable.id,
+            'product_uom_id': self.consumable.uom_id.id,
+            'company_id': move.company_id.id,
+            'location_id': location.id,
+            'location_dest_id': location_dest.id,
+            'quantity': 1,
+        })
+        return move
+
+    def assertRestrictionFields(self, move, source, dest, internal_flow):
+        self.env.flush_all()
+        self.env.invalidate_all()
+        expected = (source, dest, internal_flow)
+        for record in move | move.move_line_ids:
+            with self.subTest(model=record._name):
+                self.assertEqual((
+                    record.restriction_location_warehouse_id,
+                    record.restriction_location_dest_warehouse_id,
+                    record.restriction_internal_flow,
+                ), expected)
+
+    def test_stored_fields_and_line_copies(self):
+        no_warehouse = self.env['stock.warehouse']
+        transit_move = self._create_move(self.warehouse_a.lot_stock_id, self.customers)
+        self.assertRestrictionFields(transit_move, self.warehouse_a, no_warehouse, True)
+
+        # Emplacements du mouvement modifiés
+        transit_move.location_id = self.transit_b
+        self.assertRestrictionFields(transit_move, self.warehouse_b, no_warehouse, False)
+        transit_move.location_dest_id = self.warehouse_a.lot_stock_id
+        self.assertRestrictionFields(transit_move, self.warehouse_b, self.warehouse_a, True)
+
+        # Emplacement déplacé vers un autre entrepôt: les mouvements et leurs lignes suivent
+        shelf = self.Location.create({
+            'name': 'Étagère', 'usage': 'internal', 'location_id': self.warehouse_a.lot_stock_id.id,
+        })
+        move = self._create_move(shelf, self.customers)
+        self.assertRestrictionFields(move, self.warehouse_a, no_warehouse, True)
+        shelf.location_id = self.warehouse_b.lot_stock_id
+        self.assertRestrictionFields(move, self.warehouse_b, no_warehouse, True)
+        # Entrepôt de transit réaffecté: les mouvements existants suivent
+        self.transit_b.transit_warehouse_id = self.warehouse_a
+        self.assertRestrictionFields(transit_move, self.warehouse_a, self.warehouse_a, True)
+
+    def test_restricted_user_visibility(self):
+        moves = {
+            'transit_a': self._create_move(self.transit_a, self.customers),
+            'to_transit_a': self._create_move(self.customers, self.transit_a),
+            'transit_b': self._create_move(self.transit_b, self.customers),
+            'internal_b': self._create_move(self.warehouse_b.lot_stock_id, self.customers),
+            'internal_a': self._create_move(self.warehouse_a.lot_stock_id, self.warehouse_a.lot_stock_id),
+        }
+        all_moves = self.env['stock.move'].union(*moves.values())
+        Move = self.env['stock.move'].with_user(self.user_restricted)
+        MoveLine = self.env['stock.move.line'].with_user(self.user_restricted)
+
+        # Recherche des mouvements: source ou destination dans l'entrepôt A
+        visible = moves['transit_a'] | moves['to_transit_a'] | moves['internal_a']
+        self.assertEqual(Move.search([('id', 'in', all_moves.ids)]), visible)
+
+        # Règles d'accès: entrepôt assigné ou flux touchant un emplacement interne ou virtuel
+        # (filtré ensuite par la recherche); le transit d'un autre entrepôt est refusé
+        readable = visible | moves['internal_b']
+        for name, move in moves.items():
+            with self.subTest(move=name):
+                if move in readable:
+                    move.with_user(self.user_restricted).check_access_rule('read')
+                    move.move_line_ids.with_user(self.user_restricted).check_access_rule('read')
+                else:
+                    with self.assertRaises(AccessError):
+                        move.with_user(self.user_restricted).check_access_rule('read')
+                    with self.assertRaises(AccessError):
+                        move.move_line_ids.with_user(self.user_restricted).check_access_rule('read')
+        self.assertEqual(MoveLine.search([('id', 'in', all_moves.move_line_ids.ids)]), readable.move_line_ids)
+
+        # Sans entrepôt: aucun mouvement
+        self.assertFalse(self.env['stock.move'].with_user(self.user_no_warehouse).search([('id', 'in', all_moves.ids)]))
@@ -0,0 +1,79 @@
+from lxml import etree
+
+from odoo.tests import tagged
+from odoo.tools.safe_eval import safe_eval
+
+from .common import RestrictionCase
+
+
+@tagged('post_install', '-at_install')
+class TestPickingFormScope(RestrictionCase):
+    """
+    Domaine des emplacements du formulaire de transfert: portée par entrepôt
+    (allowed_warehouse_ids) transmise par la vue dans location_warehouse_scope.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.warehouse_c = cls.env['stock.warehouse'].create({'name': 'Restriction C', 'code': 'RSTC'})
+        cls.user_restricted.warehouse_ids |= cls.warehouse_c
+
+    def _form_field_attributes(self, field_name, picking):
+        """Domaine et contexte du champ dans le formulaire, évalués comme le client web"""
+        view = self.env.ref('stock.view_picking_form')
+        arch = etree.fromstring(picking.get_view(view.id, 'form')['arch'])
+        node = arch.xpath("//field[@name='%s'][contains(@context, 'location_warehouse_scope')]" % field_name)[0]
+        values = {
+            'is_location_restricted': picking.is_location_restricted,
+            'allowed_warehouse_ids': picking.allowed_warehouse_ids.ids,
+        }
+        return safe_eval(node.get('domain'), values), safe_eval(node.get('context'), values)
+
+    def _search_from_form(self, picking, field_name):
+        domain, context = self._form_field_attributes(field_name, picking)
+        Location = self.env['stock.location'].with_user(self.user_restricted).with_context(**context)
+        return Location.search(domain)
+
+    def test_form_domain_returns_allowed_warehouse_locations(self):
+        picking = self.create_picking(
+            self.warehouse_a.int_type_id, self.warehouse_a.lot_stock_id, self.warehouse_a.lot_stock_id,
+        ).with_user(self.user_restricted)
+        allowed = self.warehouse_a | self.warehouse_c
+        self.assertTrue(picking.is_location_restricted)
+        self.assertEqual(picking.allowed_warehouse_ids, allowed)
+
+        for field_name in ('location_id', 'location_dest_id'):
+            with self.subTest(field=field_name):
+                locations = self._search_from_form(picking, field_name)
+                self.assertEqual(locations.restriction_warehouse_id, allowed)
+                self.assertIn(self.warehouse_c.lot_stock_id, locations)
+                self.assertNotIn(self.warehouse_b.lot_stock_id, locations)
+
+        onchange_domain = picking._onchange_set_location_domains()['domain']['location_id']
+        Location = self.env['stock.location'].with_user(self.user_restricted)
+        self.assertEqual(Location.search(onchange_domain).restriction_warehouse_id, allowed)
+
+    def test_scope_context_never_widens_the_profile(self):
+        Location = self.env['stock.location'].with_user(self.user_restricted)
+        # Portée plus étroite que le profil: réduite à ses entrepôts
+        scoped = Location.with_context(location_warehouse_scope=self.warehouse_c.ids).search([])
+        self.assertEqual(scoped.restriction_warehouse_id, self.warehouse_c)
+        # Portée hors du profil, même avec un domaine qui la vise: aucun emplacement
+        outside = Location.with_context(location_warehouse_scope=self.warehouse_b.ids).search([
+            ('restriction_warehouse_id', 'in', self.warehouse_b.ids),
+        ])
+        self.assertFalse(outside)
+        # Le contexte n'accorde rien à un utilisateur sans entrepôt
+        self.assertFalse(self.env['stock.location'].with_user(self.user_no_warehouse).with_context(
+            location_warehouse_scope=self.warehouse_a.ids,
+        ).search([]))
+
+    def test_unrestricted_form_has_no_scope(self):
+        picking = self.create_picking(
+            self.warehouse_b.int_type_id, self.warehouse_b.lot_stock_id, self.warehouse_b.lot_stock_id,
+        ).with_user(self.user_manager)
+        self.assertFalse(picking.is_location_restricted)
+        domain, context = self._form_field_attributes('location_id', picking)
+        self.assertEqual(domain, [])
+        self.assertFalse(context['location_warehouse_scope'])
@@ -0,0 +1,65 @@
+from odoo.exceptions import ValidationError
+from odoo.tests import tagged
+
+from .common import RestrictionCase
+
+# Nombre maximal de requêtes de la validation des destinations, caches chauds, quel
+# que soit le nombre de transferts et d'entrepôts: transferts et types d'opération
+MAX_VALIDATION_QUERIES = 2
+# En cas de refus, le message ajoute: noms des transferts, des entrepôts et des emplacements
+MAX_REFUSAL_QUERIES = MAX_VALIDATION_QUERIES + 4
+
+
+@tagged('post_install', '-at_install')
+class TestPickingValidationQueries(RestrictionCase):
+    """Validation de N transferts répartis sur M entrepôts: lectures groupées par opération"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.extra_warehouses = cls.env['stock.warehouse'].create([
+            {'name': 'Validation %s' % i, 'code': 'RSV%s' % i} for i in range(3)
+        ])
+        cls.user_restricted.warehouse_ids |= cls.extra_warehouses
+
+    def _create_pickings(self, nb_pickings, warehouses, location_dest=None):
+        pickings = self.env['stock.picking']
+        for i in range(nb_pickings):
+            warehouse = warehouses[i % len(warehouses)]
+            pickings |= self.create_picking(
+                warehouse.int_type_id, warehouse.lot_stock_id, location_dest or warehouse.lot_stock_id,
+            )
+        return pickings.with_user(self.user_restricted)
+
+    def _count_validation(self, pickings, exception=None):
+        def validate():
+            if exception:
+                with self.assertRaises(exception):
+                    pickings._check_location_dest_allowed()
+            else:
+                pickings._check_location_dest_allowed()
+        # Remplit les caches (profil, index de l'arbre, traductions) avant la mesure
+        validate()
+        self.env.invalidate_all()
+        return self.count_queries(validate)[0]
+
+    def test_validation_query_count(self):
+        warehouses = self.warehouse_a | self.extra_warehouses
+        counts = {}
+        for nb_pickings, nb_warehouses in ((1, 1), (8, 2), (40, 4)):
+            pickings = self._create_pickings(nb_pickings, warehouses[:nb_warehouses])
+            counts[nb_pickings, nb_warehouses] = count = self._count_validation(pickings)
+            self.assertLessEqual(count, MAX_VALIDATION_QUERIES, "%s transferts, %s entrepôts" % (nb_pickings, nb_warehouses))
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_refusal_query_count(self):
+        """Le message d'erreur lit les noms en une requête par modèle"""
+        warehouses = self.warehouse_a | self.extra_warehouses
+        counts = {}
+        for nb_pickings, nb_warehouses in ((1, 1), (40, 4)):
+            pickings = self._create_pickings(
+                nb_pickings, warehouses[:nb_warehouses], location_dest=self.warehouse_b.lot_stock_id,
+            )
+            counts[nb_pickings, nb_warehouses] = count = self._count_validation(pickings, ValidationError)
+            self.assertLessEqual(count, MAX_REFUSAL_QUERIES, "%s transferts, %s entrepôts" % (nb_pickings, nb_warehouses))
+        self.assertEqual(len(set(counts.values())), 1, counts)
@@ -0,0 +1,71 @@
+from odoo.exceptions import AccessError
+from odoo.tests import tagged
+
+from .common import RestrictionCase
+
+
+@tagged('post_install', '-at_install')
+class TestPreflightLocationRestrictions(RestrictionCase):
+
+    def _row(self, picking_type, location, location_dest, **values):
+        return dict({
+            'picking_type_id': picking_type.id,
+            'location_id': location.id,
+            'location_dest_id': location_dest.id,
+        }, **values)
+
+    def test_empty_batch(self):
+        Picking = self.env['stock.picking'].with_user(self.user_restricted)
+        self.assertEqual(Picking.preflight_location_restrictions([]), [])
+
+    def test_verdicts(self):
+        Picking = self.env['stock.picking'].with_user(self.user_restricted)
+        stock_a, stock_b = self.warehouse_a.lot_stock_id, self.warehouse_b.lot_stock_id
+        rows = [
+            self._row(self.warehouse_a.int_type_id, stock_a, stock_a),
+            self._row(self.warehouse_a.int_type_id, stock_a, stock_b),
+            self._row(self.warehouse_b.int_type_id, stock_b, stock_b),
+        ]
+        verdicts = Picking.preflight_location_restrictions(rows)
+        self.assertEqual([verdict['valid'] for verdict in verdicts], [True, False, False])
+        self.assertIn(str(stock_b.id), verdicts[1]['message'])
+        # Les noms des autres entrepôts ne sont pas divulgués
+        for verdict in verdicts[1:]:
+            self.assertNotIn(self.warehouse_b.name, verdict['message'])
+            self.assertNotIn(stock_b.complete_name, verdict['message'])
+
+    def test_missing_records(self):
+        Picking = self.env['stock.picking'].with_user(self.user_restricted)
+        stock_a = self.warehouse_a.lot_stock_id
+        missing_id = self.Location.with_context(active_test=False).search([], order='id desc', limit=1).id + 1000
+        rows = [
+            {'picking_type_id': 0, 'location_id': stock_a.id, 'location_dest_id': stock_a.id},
+            {'picking_type_id': self.warehouse_a.int_type_id.id, 'location_id': stock_a.id, 'location_dest_id': missing_id},
+        ]
+        verdicts = Picking.preflight_location_restrictions(rows)
+        self.assertEqual([verdict['valid'] for verdict in verdicts], [False, False])
+        self.assertIn(str(missing_id), verdicts[1]['message'])
+
+        manager_rows = [self._row(self.warehouse_a.int_type_id, stock_a, stock_a, user_id=self.user_manager.id + 1000)]
+        verdicts = self.env['stock.picking'].with_user(self.user_manager).preflight_location_restrictions(manager_rows)
+        self.assertFalse(verdicts[0]['valid'])
+
+    def test_other_users(self):
+        stock_a, stock_b = self.warehouse_a.lot_stock_id, self.warehouse_b.lot_stock_id
+        rows = [self._row(self.warehouse_a.int_type_id, stock_a, stock_b, user_id=self.user_restricted.id)]
+        with self.assertRaises(AccessError):
+            self.env['stock.picking'].with_user(self.user_no_warehouse).preflight_location_restrictions(rows)
+        verdicts = self.env['stock.picking'].with_user(self.user_manager).preflight_location_restrictions(rows)
+        self.assertFalse(verdicts[0]['valid'])
+
+    def test_constant_query_count(self):
+        """Le nombre de requêtes ne dépend pas de la taille du lot"""
+        Picking = self.env['stock.picking'].with_user(self.user_restricted)
+        stock_a, stock_b = self.warehouse_a.lot_stock_id, self.warehouse_b.lot_stock_id
+        row = self._row(self.warehouse_a.int_type_id, stock_a, stock_b)
+        Picking.preflight_location_restrictions([row])
+        counts = []
+        for size in (10, 1000):
+            self.env.invalidate_all()
+            counts.append(self.count_queries(lambda: Picking.preflight_location_restrictions([row] * size))[0])
+        self.assertEqual(counts[0], counts[1])
@@ -0,0 +1,156 @@
+import logging
+import re
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.sql_db import Cursor
+from odoo.tests import tagged
+
+from .common import RestrictionCase
+
+_logger = logging.getLogger(__name__)
+
+# Nombres de besoins lancés par mesure
+PROCUREMENT_SIZES = (50, 400)
+
+# Tables portant des champs de restriction recalculés à la création par une route
+RESTRICTION_TABLES = ('stock_move', 'stock_move_line', 'stock_picking')
+
+_UPDATE_RE = re.compile(r'^\s*UPDATE\s+"?(\w+)"?\s+SET\s+(.*?)\s+(?:FROM|WHERE)\s', re.IGNORECASE | re.DOTALL)
+_SET_COLUMN_RE = re.compile(r'"?(\w+)"?\s*=')
+
+
+def _restriction_only_update(query):
+    """Table mise à jour si la requête n'écrit que des champs de restriction, sinon None"""
+    match = _UPDATE_RE.match(query)
+    if not match or match.group(1) not in RESTRICTION_TABLES:
+        return None
+    columns = set(_SET_COLUMN_RE.findall(match.group(2)))
+    if columns and all(column.startswith('restriction_') for column in columns):
+        return match.group(1)
+    return None
+
+
+@tagged('post_install', '-at_install', '-standard', 'restric_benchmark')
+class TestProcurementBenchmark(RestrictionCase):
+    """
+    Travail propre au module quand le planificateur crée des mouvements et des transferts
+    par route (--test-tags restric_benchmark): requêtes qui n'écrivent que les champs de
+    restriction stockés et durée des calculs de ces champs, comparées au coût total de
+    procurement.group.run() puis de la réservation, pour plusieurs nombres de besoins.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Consommable: réservé sans stock, les lignes de mouvement sont créées
+        cls.consumable = cls.env['product.product'].create({'name': 'Consommable planificateur', 'type': 'consu'})
+        cls.customers = cls.env.ref('stock.stock_location_customers')
+        # Livraison en une étape (A) et en deux étapes chaînées (B)
+        cls.warehouse_b.delivery_steps = 'pick_ship'
+
+    def _restriction_fields(self):
+        """Champs de restriction stockés et calculés des mouvements, lignes et transferts"""
+        return [
+            field
+            for model_name in ('stock.move', 'stock.move.line', 'stock.picking')
+            for name, field in self.env[model_name]._fields.items()
+            if name.startswith('restriction_') and field.store and field.compute
+        ]
+
+    def _procurements(self, warehouse, size):
+        """Un besoin par groupe d'approvisionnement: un transfert par besoin"""
+        ProcurementGroup = self.env['procurement.group']
+        groups = ProcurementGroup.create([{'name': 'Mesure %s' % i} for i in range(size)])
+        now = fields.Datetime.now()
+        return groups, [
+            ProcurementGroup.Procurement(
+                self.consumable, 1, self.consumable.uom_id, self.customers,
+                self.consumable.name, group.name, self.env.company,
+                {'warehouse_id': warehouse, 'group_id': group, 'date_planned': now},
+            )
+            for group in groups
+        ]
+
+    def _measure(self, warehouse, size):
+        """Lance les besoins et leur réservation; retourne les mesures totales et propres au module"""
+        groups, procurements = self._procurements(warehouse, size)
+        self.env.flush_all()
+        stats = {'queries': 0, 'restriction_queries': {}, 'restriction_sql': 0.0, 'computes': 0, 'compute': 0.0}
+
+        execute = Cursor.execute
+
+        def measured_execute(cursor, query, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return execute(cursor, query, *args, **kwargs)
+            finally:
+                stats['queries'] += 1
+                table = _restriction_only_update(str(getattr(query, 'code', query)))
+                if table:
+                    stats['restriction_queries'][table] = stats['restriction_queries'].get(table, 0) + 1
+                    stats['restriction_sql'] += time.perf_counter() - start
+
+        def timed(compute, records):
+            start = time.perf_counter()
+            try:
+                return fields.determine(compute, records)
+            finally:
+                stats['computes'] += 1
+                stats['compute'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            stack.enter_context(patch.object(Cursor, 'execute', measured_execute))
+            # Calculs des champs de restriction stockés (champs liés compris)
+            for field in self._restriction_fields():
+                stack.enter_context(patch.object(
+                    field, 'compute', lambda records, compute=field.compute: timed(compute, records),
+                ))
+            self.env['procurement.group'].run(procurements)
+            moves = self.env['stock.move'].search([('group_id', 'in', groups.ids)])
+            moves._action_assign()
+            self.env.flush_all()
+        stats['duration'] = time.perf_counter() - start
+        stats['moves'] = moves
+        return stats
+
+    def test_benchmark_procurements(self):
+        results = {}
+        for warehouse in (self.warehouse_a, self.warehouse_b):
+            for size in PROCUREMENT_SIZES:
+                stats = self._measure(warehouse, size)
+                moves = stats['moves']
+                results[warehouse.delivery_steps, size] = stats
+                _logger.info(
+                    "%-9s %4s besoins, %4s mouvements, %4s lignes: %5s requêtes %8.1fms (%.2fms/besoin) | "
+                    "restriction: %s requêtes %s, %.1fms SQL, %s calculs %.1fms (%.3fms/besoin)",
+                    warehouse.delivery_steps, size, len(moves), len(moves.move_line_ids),
+                    stats['queries'], stats['duration'] * 1000, stats['duration'] * 1000 / size,
+                    sum(stats['restriction_queries'].values()), stats['restriction_queries'],
+                    stats['restriction_sql'] * 1000, stats['computes'], stats['compute'] * 1000,
+                    (stats['restriction_sql'] + stats['compute']) * 1000 / size,
+                )
+                # Les champs de restriction des mouvements, de leurs lignes et des transferts
+                # créés par route sont bien remplis
+                with self.subTest(steps=warehouse.delivery_steps, size=size):
+                    self.assertTrue(moves.picking_id)
+                    self.assertTrue(all(moves.picking_id.mapped('created_by_route')))
+                    self.assertEqual(moves.picking_id.restriction_warehouse_id, warehouse)
+                    self.assertEqual(moves.restriction_location_warehouse_id, warehouse)
+                    self.assertTrue(all(moves.mapped('restriction_internal_flow')))
+                    self.assertTrue(moves.move_line_ids)
+                    self.assertEqual(moves.move_line_ids.restriction_location_warehouse_id, warehouse)
+
+        # Travail par lot, pas par enregistrement: le nombre de requêtes propres aux champs
+        # de restriction et d'appels de leurs calculs ne croît pas avec le nombre de besoins
+        small, large = PROCUREMENT_SIZES
+        for steps in ('ship_only', 'pick_ship'):
+            with self.subTest(steps=steps):
+                self.assertLessEqual(
+                    sum(results[steps, large]['restriction_queries'].values()),
+                    sum(results[steps, small]['restriction_queries'].values()),
+                )
+                self.assertLessEqual(results[steps, large]['computes'], results[steps, small]['computes'])
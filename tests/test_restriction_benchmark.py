@@ -0,0 +1,131 @@
+import logging
+
+from odoo.exceptions import AccessError, ValidationError
+from odoo.tests import tagged
+
+from odoo.addons.restric_entrepot1.models import restriction_cache
+from .common import RestrictionCase, RestrictionTopologyCase
+
+_logger = logging.getLogger(__name__)
+
+SEARCH_MODELS = ('stock.location', 'stock.move', 'stock.quant', 'stock.picking', 'stock.picking.type')
+
+# Référence: nombre maximal de requêtes d'un search_count([]) par profil, caches chauds.
+# Une surcharge _search() qui ajoute une requête fait échouer le test.
+QUERY_BASELINE = {
+    'unrestricted': dict.fromkeys(SEARCH_MODELS, 1),
+    'restricted': dict.fromkeys(SEARCH_MODELS, 1),
+    # Restriction vide par construction: aucune requête
+    'no_warehouse': dict.fromkeys(SEARCH_MODELS, 0),
+}
+# Requêtes ajoutées par une nouvelle transaction (caches du processus chauds): lecture
+# de la version des caches de restriction, jamais pour un utilisateur sans restriction
+NEW_TRANSACTION_QUERIES = {'unrestricted': 0, 'restricted': 1, 'no_warehouse': 1}
+
+# Champs lus à l'ouverture du formulaire d'un transfert
+FORM_FIELDS = [
+    'name', 'state', 'picking_type_id', 'location_id', 'location_dest_id',
+    'is_location_restricted', 'allowed_warehouse_ids', 'move_ids',
+]
+
+
+@tagged('post_install', '-at_install')
+class TestRestrictionQueryCount(RestrictionCase):
+    """Nombre de requêtes des surcharges, comparé à QUERY_BASELINE"""
+
+    def test_search_query_counts(self):
+        for profile, user in self.profile_users.items():
+            for model_name in SEARCH_MODELS:
+                Model = self.env[model_name].with_user(user)
+                # Remplit les caches (profil, règles d'accès) avant la mesure
+                Model.search_count([])
+                with self.subTest(profile=profile, model=model_name), \
+                        self.assertQueryCount(QUERY_BASELINE[profile][model_name]):
+                    Model.search_count([])
+
+    def test_new_transaction_query_counts(self):
+        """Première recherche d'une transaction: la version n'est lue que si le profil l'exige"""
+        for profile, user in self.profile_users.items():
+            for model_name in SEARCH_MODELS:
+                Model = self.env[model_name].with_user(user)
+                Model.search_count([])
+                # Nouvelle transaction: version et caches privés oubliés, cache de l'ORM vidé
+                restriction_cache.reset_transaction(self.cr)
+                self.env.invalidate_all()
+                expected = QUERY_BASELINE[profile][model_name] + NEW_TRANSACTION_QUERIES[profile]
+                with self.subTest(profile=profile, model=model_name), self.assertQueryCount(expected):
+                    Model.search_count([])
+
+    def test_picking_form_and_validation(self):
+        picking = self.create_picking(
+            self.warehouse_a.int_type_id, self.warehouse_a.lot_stock_id, self.warehouse_a.lot_stock_id,
+        )
+        counts = {}
+        for profile in ('unrestricted', 'restricted'):
+            user_picking = picking.with_user(self.profile_users[profile])
+            user_picking.read(FORM_FIELDS)
+            self.env.invalidate_all()
+            counts[profile] = self.count_queries(lambda: user_picking.read(FORM_FIELDS))[0]
+        # La restriction ne coûte pas plus de deux requêtes à l'ouverture du formulaire
+        self.assertLessEqual(counts['restricted'], counts['unrestricted'] + 2)
+
+        restricted_picking = picking.with_user(self.user_restricted)
+        restricted_picking._check_location_dest_allowed()
+        self.env.invalidate_all()
+        # Lecture des transferts et des types d'opération; appartenance résolue par l'index
+        with self.assertQueryCount(2):
+            restricted_picking._check_location_dest_allowed()
+
+
+@tagged('post_install', '-at_install', '-standard', 'restric_benchmark')
+class TestRestrictionBenchmark(RestrictionTopologyCase):
+    """
+    Mesures sur une topologie synthétique, par profil (--test-tags restric_benchmark).
+    Durées et nombres de requêtes, caches froids puis chauds, écrits dans les logs;
+    les nombres de requêtes en régime établi sont comparés à QUERY_BASELINE.
+    """
+
+    def _measure_cold_and_warm(self, func):
+        self.env.invalidate_all()
+        restriction_cache.reset_transaction(self.cr)
+        restriction_cache.clear_shared(self.cr.dbname)
+        cold = self.count_queries(func)
+        self.env.invalidate_all()
+        warm = self.count_queries(func)
+        return cold, warm
+
+    def test_benchmark_profiles(self):
+        picking = self.env['stock.picking'].search([
+            ('picking_type_id', 'in', self.bench_warehouses[0].int_type_id.ids),
+        ], limit=1)
+        lines = []
+        for profile, user in self.profile_users.items():
+            for model_name in SEARCH_MODELS:
+                Model = self.env[model_name].with_user(user)
+                cold, warm = self._measure_cold_and_warm(lambda: Model.search_count([]))
+                lines.append((profile, 'search %s' % model_name, cold, warm))
+                self.assertLessEqual(
+                    warm[0], QUERY_BASELINE[profile][model_name],
+                    "%s, %s: plus de requêtes que la référence" % (profile, model_name),
+                )
+
+            user_picking = picking.with_user(user)
+            try:
+                cold, warm = self._measure_cold_and_warm(lambda: user_picking.read(FORM_FIELDS))
+                lines.append((profile, 'formulaire', cold, warm))
+            except AccessError:
+                lines.append((profile, 'formulaire', None, None))
+            try:
+                cold, warm = self._measure_cold_and_warm(user_picking._check_location_dest_allowed)
+                lines.append((profile, 'validation', cold, warm))
+            except (AccessError, ValidationError):
+                lines.append((profile, 'validation', None, None))
+
+        for profile, operation, cold, warm in lines:
+            if cold is None:
+                _logger.info("%-13s %-26s refusé", profile, operation)
+                continue
+            _logger.info(
+                "%-13s %-26s froid: %3s requêtes %8.1fms | chaud: %3s requêtes %8.1fms",
+                profile, operation, cold[0], cold[1], warm[0], warm[1],
+            )
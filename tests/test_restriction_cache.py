@@ -0,0 +1,254 @@
+import logging
+import random
+import threading
+import time
+
+from odoo import SUPERUSER_ID, api
+from odoo.tests import TransactionCase, new_test_user, tagged
+
+from odoo.addons.restric_entrepot1.models import restriction_cache
+from .common import RESTRICTED_GROUPS
+
+_logger = logging.getLogger(__name__)
+
+
+class _FakeDatabase:
+    """Affectations validées {uid: entrepôts} et version, modifiées ensemble au commit"""
+
+    def __init__(self, assignments):
+        self.lock = threading.Lock()
+        self.version = 0
+        self.assignments = dict(assignments)
+
+    def snapshot(self):
+        with self.lock:
+            return self.version, dict(self.assignments)
+
+    def commit(self, uid, warehouse_ids):
+        with self.lock:
+            self.assignments[uid] = warehouse_ids
+            self.version += 1
+
+
+class _FakeCallbacks:
+    def __init__(self):
+        self.data = {}
+
+
+class _FakeCursor:
+    """Transaction en lecture répétable: version et affectations du même instantané"""
+
+    def __init__(self, database, dbname):
+        self.dbname = dbname
+        self.postcommit = _FakeCallbacks()
+        self.version, self.assignments = database.snapshot()
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchone(self):
+        # Seule requête émise par restriction_cache: la lecture du compteur (version)
+        return (self.version,)
+
+
+@tagged('post_install', '-at_install')
+class TestRestrictionCache(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        restriction_cache.reset_transaction(self.cr)
+        self.addCleanup(restriction_cache.reset_transaction, self.cr)
+
+    def test_uncommitted_changes_use_private_store(self):
+        """Une transaction qui modifie les restrictions ne lit ni n'alimente le cache partagé"""
+        version = restriction_cache.get_version(self.cr)
+        shared = restriction_cache.get_store(self.cr)
+        shared['probe'] = True
+        self.addCleanup(shared.pop, 'probe', None)
+
+        self.env['stock.location']._invalidate_allowed_location_cache()
+        private = restriction_cache.get_store(self.cr)
+        self.assertIsNot(private, shared)
+        self.assertNotIn('probe', private)
+        self.assertTrue(restriction_cache.is_changed(self.cr))
+
+        # Transaction suivante: la modification fait partie de la version lue
+        restriction_cache.reset_transaction(self.cr)
+        self.assertGreater(restriction_cache.get_version(self.cr), version)
+
+    def test_version_counter(self):
+        """Un compteur sur une seule ligne, incrémenté à chaque modification"""
+        version = restriction_cache.get_version(self.cr)
+        for _i in range(3):
+            restriction_cache.mark_changed(self.cr)
+        restriction_cache.reset_transaction(self.cr)
+        self.assertEqual(restriction_cache.get_version(self.cr), version + 3)
+        self.cr.execute("SELECT COUNT(*) FROM %s" % restriction_cache.VERSION_TABLE)
+        self.assertEqual(self.cr.fetchone()[0], 1)
+
+    def test_concurrent_readers_never_see_stale_entries(self):
+        """
+        Des lecteurs (utilisateurs restreints) interrogent en parallèle le cache des
+        entrepôts effectifs pendant que les affectations changent. Chaque valeur
+        lue doit être celle que calcule l'instantané de la transaction qui la lit.
+        """
+        dbname = 'restriction_cache_concurrency_%s' % id(self)
+        restriction_cache._ready_dbnames.add(dbname)
+        self.addCleanup(restriction_cache._ready_dbnames.discard, dbname)
+        self.addCleanup(restriction_cache._stores.pop, dbname, None)
+
+        user_ids = list(range(1, 51))
+        warehouse_ids = list(range(1, 11))
+        database = _FakeDatabase({uid: (uid % 10 + 1,) for uid in user_ids})
+        stop = threading.Event()
+        latencies, violations = [], []
+        commits = []
+
+        def compute(cr, uid):
+            return tuple(sorted(cr.assignments[uid]))
+
+        def reader(seed):
+            rng = random.Random(seed)
+            local = []
+            while not stop.is_set():
+                cr = _FakeCursor(database, dbname)
+                for _i in range(5):
+                    uid = rng.choice(user_ids)
+                    start = time.perf_counter()
+                    value = restriction_cache.cached(cr, restriction_cache.PROFILES, uid, lambda: compute(cr, uid))
+                    local.append(time.perf_counter() - start)
+                    if value != compute(cr, uid):
+                        violations.append((cr.version, uid, value))
+            latencies.extend(local)
+
+        def writer():
+            rng = random.Random(0)
+            while not stop.is_set():
+                uid = rng.choice(user_ids)
+                database.commit(uid, tuple(sorted(rng.sample(warehouse_ids, rng.randint(1, 3)))))
+                commits.append(uid)
+                time.sleep(0.001)
+
+        threads = [threading.Thread(target=reader, args=(seed,)) for seed in range(8)]
+        threads.append(threading.Thread(target=writer))
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(1.0)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - start
+
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e6
+
+        _logger.info(
+            "Cache de restriction: %s lectures/s, %s affectations modifiées, "
+            "latence p50 %.1fµs p95 %.1fµs p99 %.1fµs, %s lectures périmées",
+            int(len(latencies) / duration), len(commits),
+            percentile(0.50), percentile(0.95), percentile(0.99), len(violations),
+        )
+        self.assertTrue(latencies)
+        self.assertTrue(commits)
+        self.assertFalse(violations, "Valeurs lues différentes de l'instantané de la transaction")
+
+
+@tagged('post_install', '-at_install')
+class TestRestrictionCacheTransactions(TransactionCase):
+    """
+    Deux transactions réelles, comme deux workers: l'une modifie les données de
+    restriction et valide, l'autre recherche ensuite transferts, mouvements et quants.
+
+    Les données de test sont validées (chaque curseur ne voit que ce qui est validé)
+    puis supprimées à la fin du test. Le curseur du test n'est pas utilisé: il ne
+    doit pas verrouiller le compteur de version.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(restriction_cache.clear_shared, self.cr.dbname)
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {'tracking_disable': True})
+            warehouse = env.ref('stock.warehouse0')
+            product = env['product.product'].create({'name': 'Produit concurrence', 'type': 'product'})
+            location = env['stock.location'].with_context(bypass_location_security=True).create({
+                'name': 'Concurrence', 'usage': 'internal', 'location_id': warehouse.lot_stock_id.id,
+            })
+            env['stock.quant']._update_available_quantity(product, location, 3)
+            customers = env.ref('stock.stock_location_customers')
+            picking = env['stock.picking'].create({
+                'picking_type_id': warehouse.out_type_id.id,
+                'location_id': location.id,
+                'location_dest_id': customers.id,
+                'move_ids': [(0, 0, {
+                    'name': product.name,
+                    'product_id': product.id,
+                    'product_uom': product.uom_id.id,
+                    'product_uom_qty': 1,
+                    'location_id': location.id,
+                    'location_dest_id': customers.id,
+                })],
+            })
+            user = new_test_user(env, login='restric_concurrence', groups=RESTRICTED_GROUPS)
+            self.ids = {
+                'warehouse': warehouse.id,
+                'product': product.id,
+                'location': location.id,
+                'user': user.id,
+                'stock.picking': picking.ids,
+                'stock.move': picking.move_ids.ids,
+                'stock.quant': env['stock.quant'].search([('location_id', '=', location.id)]).ids,
+            }
+        self.addCleanup(self._delete_committed_data)
+
+    def _delete_committed_data(self):
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            env['stock.picking'].browse(self.ids['stock.picking']).unlink()
+            cr.execute("DELETE FROM stock_quant WHERE location_id = %s", [self.ids['location']])
+            env['stock.location'].with_context(bypass_location_security=True).browse(self.ids['location']).unlink()
+            env['res.users'].browse(self.ids['user']).unlink()
+            env['product.product'].browse(self.ids['product']).unlink()
+
+    def _admin_write(self, model_name, record_id, vals):
+        """Modification validée par une autre transaction"""
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {'bypass_location_security': True})
+            env[model_name].browse(record_id).write(vals)
+
+    def _visible(self, cr):
+        """Nombre d'enregistrements de test visibles par l'utilisateur restreint, par modèle"""
+        env = api.Environment(cr, self.ids['user'], {})
+        return {
+            model_name: env[model_name].search_count([('id', 'in', self.ids[model_name])])
+            for model_name in ('stock.picking', 'stock.move', 'stock.quant')
+        }
+
+    def _visible_in_new_transaction(self):
+        with self.registry.cursor() as cr:
+            return self._visible(cr)
+
+    def test_committed_changes_are_seen_by_other_transactions(self):
+        nothing = {'stock.picking': 0, 'stock.move': 0, 'stock.quant': 0}
+        everything = {'stock.picking': 1, 'stock.move': 1, 'stock.quant': 1}
+        self.assertEqual(self._visible_in_new_transaction(), nothing)
+
+        with self.registry.cursor() as old_cr:
+            # Transaction ouverte avant la modification: son instantané est antérieur
+            self.assertEqual(self._visible(old_cr), nothing)
+            self._admin_write('res.users', self.ids['user'], {'warehouse_ids': [(6, 0, [self.ids['warehouse']])]})
+            self.assertEqual(self._visible_in_new_transaction(), everything)
+            # Elle reste cohérente avec son instantané et n'alimente pas les caches partagés
+            self.assertEqual(self._visible(old_cr), nothing)
+        self.assertEqual(self._visible_in_new_transaction(), everything)
+
+        # L'emplacement sort de l'entrepôt: ses quants et mouvements ne sont plus visibles,
+        # le transfert reste rattaché à l'entrepôt par son type d'opération
+        physical = self.env.ref('stock.stock_location_locations')
+        self._admin_write('stock.location', self.ids['location'], {'location_id': physical.id})
+        self.assertEqual(
+            self._visible_in_new_transaction(), {'stock.picking': 1, 'stock.move': 0, 'stock.quant': 0},
+        )
@@ -0,0 +1,34 @@
+from odoo.tests import tagged
+
+from .common import RestrictionCase
+
+
+@tagged('post_install', '-at_install')
+class TestRestrictionColumnsCron(RestrictionCase):
+
+    def test_consistent_columns_are_left_untouched(self):
+        result = self.Location._cron_check_restriction_columns()
+        self.assertEqual(result['inconsistent'], {})
+        self.assertFalse(result['rebuilt'])
+
+    def test_drifted_columns_are_rebuilt(self):
+        stock_a = self.warehouse_a.lot_stock_id
+        self.env.flush_all()
+        # Modification hors ORM: l'emplacement n'est plus rattaché à son entrepôt
+        self.cr.execute(
+            "UPDATE stock_location SET restriction_warehouse_id = %s WHERE id = %s",
+            [self.warehouse_b.id, stock_a.id],
+        )
+        self.env.invalidate_all()
+
+        result = self.Location._cron_check_restriction_columns()
+        self.assertEqual(result['inconsistent'], {'stock.location': 1})
+        self.assertTrue(result['rebuilt'])
+        self.assertEqual(stock_a.restriction_warehouse_id, self.warehouse_a)
+        self.assertEqual(self.Location._check_restriction_warehouse_consistency(), {})
+
+    def test_upgrade_triggers_the_check(self):
+        cron = self.env.ref('restric_entrepot1.ir_cron_check_restriction_columns')
+        triggers = self.env['ir.cron.trigger'].search([('cron_id', '=', cron.id)])
+        self.Location._trigger_restriction_columns_check()
+        self.assertGreater(self.env['ir.cron.trigger'].search_count([('cron_id', '=', cron.id)]), len(triggers))
@@ -0,0 +1,80 @@
+from odoo.tests import tagged
+
+from odoo.addons.restric_entrepot1.models.restriction_domain import (
+    optimize_restriction_domain, restrict_search_domain,
+)
+from .common import RestrictionCase
+
+
+@tagged('post_install', '-at_install')
+class TestRestrictionDomain(RestrictionCase):
+
+    def test_merge_only_model_columns(self):
+        Picking = self.env['stock.picking']
+        # Colonne stockée du modèle: seule l'intersection peut correspondre
+        self.assertEqual(
+            optimize_restriction_domain(
+                Picking, [('restriction_warehouse_id', 'in', [1, 2])], [('restriction_warehouse_id', 'in', [2, 3])],
+            ),
+            [('restriction_warehouse_id', 'in', [2])],
+        )
+        self.assertIsNone(optimize_restriction_domain(
+            Picking, [('restriction_warehouse_id', 'in', [1])], [('restriction_warehouse_id', 'in', [2])],
+        ))
+        # x2many et chemins: chaque feuille est conservée telle quelle
+        for field in ('move_ids', 'picking_type_id.warehouse_id'):
+            args = [(field, 'in', [1]), (field, 'in', [2])]
+            self.assertEqual(optimize_restriction_domain(Picking, args, [('id', '!=', 0)]), args + [('id', '!=', 0)])
+        # Feuilles identiques dédoublonnées
+        self.assertEqual(
+            optimize_restriction_domain(Picking, [('state', '=', 'draft')], [('state', '=', 'draft')]),
+            [('state', '=', 'draft')],
+        )
+
+    def test_x2many_leaves_search(self):
+        """Régression: deux feuilles `in` sur move_ids désignent un transfert ayant les deux mouvements"""
+        picking = self.create_picking(
+            self.warehouse_a.int_type_id, self.warehouse_a.lot_stock_id, self.warehouse_a.lot_stock_id,
+        )
+        second_move = picking.move_ids.copy({'picking_id': picking.id})
+        domain = [('move_ids', 'in', picking.move_ids[0].ids), ('move_ids', 'in', second_move.ids)]
+        for user in (self.user_manager, self.user_restricted):
+            self.assertEqual(self.env['stock.picking'].with_user(user).search(domain), picking)
+
+    def test_restrict_search_domain_by_profile(self):
+        def build(warehouse_ids):
+            return [('restriction_warehouse_id', 'in', warehouse_ids)]
+        args = [('state', '=', 'draft')]
+        Picking = self.env['stock.picking']
+        self.assertEqual(restrict_search_domain(Picking.with_user(self.user_manager), args, build), args)
+        self.assertEqual(
+            restrict_search_domain(Picking.with_user(self.user_restricted), args, build),
+            args + [('restriction_warehouse_id', 'in', self.warehouse_a.ids)],
+        )
+        self.assertIsNone(restrict_search_domain(Picking.with_user(self.user_no_warehouse), args, build))
+
+    def test_provably_empty_without_queries(self):
+        for model_name in ('stock.location', 'stock.move', 'stock.quant', 'stock.picking', 'stock.picking.type'):
+            Model = self.env[model_name].with_user(self.user_no_warehouse)
+            Model.search_count([])
+            with self.assertQueryCount(0):
+                self.assertEqual(Model.search_count([]), 0)
+
+        # Intersection vide avec la restriction de l'utilisateur (entrepôt A)
+        Picking = self.env['stock.picking'].with_user(self.user_restricted)
+        Picking.search_count([])
+        with self.assertQueryCount(0):
+            self.assertFalse(Picking.search([('restriction_warehouse_id', 'in', self.warehouse_b.ids)]))
+
+    def test_explicit_ids(self):
+        """Une liste d'IDs explicite est combinée à la restriction dans la même requête"""
+        Location = self.env['stock.location'].with_user(self.user_restricted)
+        allowed = self.warehouse_a.lot_stock_id | self.warehouse_a.view_location_id
+        domain = [('active', '=', True), ('id', 'in', allowed.ids)]
+        # Remplit les caches (profil, version) avant la mesure
+        Location.search(domain)
+        with self.assertQueryCount(1):
+            self.assertEqual(Location.search(domain), allowed)
+        # Un ID hors de l'ensemble autorisé: la restriction s'applique
+        outside = domain[:1] + [('id', 'in', (allowed | self.warehouse_b.lot_stock_id).ids)]
+        self.assertEqual(Location.search(outside), allowed)
@@ -0,0 +1,98 @@
+from odoo.tests import tagged
+from odoo.tools import SQL
+
+from .common import RestrictionCase
+
+TRANSIT_INDEXES = {'stock_location_transit_by_warehouse_idx', 'stock_location__transit_warehouse_id_index'}
+
+
+def _index_names(plan):
+    """Noms des index parcourus par un plan EXPLAIN (FORMAT JSON)"""
+    names = set()
+    if isinstance(plan, dict):
+        if 'Index Name' in plan:
+            names.add(plan['Index Name'])
+        for value in plan.values():
+            names |= _index_names(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            names |= _index_names(value)
+    return names
+
+
+@tagged('post_install', '-at_install')
+class TestRestrictionIndexes(RestrictionCase):
+    """
+    Plans des requêtes de restriction: chacune peut être servie par ses index.
+
+    Les tables de test sont petites: le parcours séquentiel est désactivé pour que
+    le planificateur montre l'index qu'il utiliserait sur une grande base.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.transit_view = cls.Location.create({
+            'name': 'Inter-Transit A',
+            'usage': 'view',
+            'location_id': cls.env.ref('stock.stock_location_locations_virtual').id,
+            'transit_warehouse_id': cls.warehouse_a.id,
+        })
+        cls.Location.create({
+            'name': 'Transit A',
+            'usage': 'transit',
+            'location_id': cls.transit_view.id,
+            'transit_warehouse_id': cls.warehouse_a.id,
+        })
+
+    def setUp(self):
+        super().setUp()
+        self.cr.execute("SET LOCAL enable_seqscan = off")
+
+    def assertQueryUsesIndexes(self, model, domain, expected, any_of=False):
+        query = model._search(domain)
+        self.cr.execute(SQL("EXPLAIN (FORMAT JSON) %s", query.select()))
+        used = _index_names(self.cr.fetchone()[0])
+        if any_of:
+            self.assertTrue(used & expected, "Aucun index parmi %s: %s" % (sorted(expected), sorted(used)))
+        else:
+            self.assertLessEqual(expected, used, "Plan: %s" % sorted(used))
+
+    def test_transit_indexes(self):
+        warehouse_ids = (self.warehouse_a | self.warehouse_b).ids
+        # Enfants des Inter-Transit (StockPicking._get_inter_transit_children_locations)
+        self.assertQueryUsesIndexes(self.Location, [
+            ('transit_warehouse_id', 'in', warehouse_ids),
+            ('location_id.usage', '=', 'view'),
+            ('location_id.transit_warehouse_id', 'in', warehouse_ids),
+        ], TRANSIT_INDEXES, any_of=True)
+        self.assertQueryUsesIndexes(
+            self.Location, [('transit_warehouse_id', '=', self.warehouse_a.id)], TRANSIT_INDEXES, any_of=True,
+        )
+
+    def test_restriction_warehouse_indexes(self):
+        warehouse_ids = self.warehouse_a.ids
+        self.assertQueryUsesIndexes(
+            self.Location, [('restriction_warehouse_id', 'in', warehouse_ids)],
+            {'stock_location__restriction_warehouse_id_index'},
+        )
+        self.assertQueryUsesIndexes(
+            self.env['stock.quant'], [('restriction_warehouse_id', 'in', warehouse_ids)],
+            {'stock_quant__restriction_warehouse_id_index'},
+        )
+        self.assertQueryUsesIndexes(self.env['stock.move'], [
+            '|',
+            ('restriction_location_warehouse_id', 'in', warehouse_ids),
+            ('restriction_location_dest_warehouse_id', 'in', warehouse_ids),
+        ], {
+            'stock_move__restriction_location_warehouse_id_index',
+            'stock_move__restriction_location_dest_warehouse_id_index',
+        })
+
+    def test_picking_rule_indexes(self):
+        """Les deux branches de la règle d'accès des transferts ont chacune leur index"""
+        self.assertQueryUsesIndexes(self.env['stock.picking'], [
+            '|',
+            ('restriction_warehouse_id', 'in', self.warehouse_a.ids),
+            ('created_by_route', '=', True),
+        ], {'stock_picking__restriction_warehouse_id_index', 'stock_picking_created_by_route_idx'})
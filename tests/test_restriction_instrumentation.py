@@ -0,0 +1,49 @@
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from odoo.addons.restric_entrepot1.models import restriction_instrumentation
+from .common import RestrictionCase
+
+LOGGER = restriction_instrumentation.__name__
+
+
+@tagged('post_install', '-at_install')
+class TestRestrictionInstrumentation(RestrictionCase):
+
+    def setUp(self):
+        super().setUp()
+        restriction_instrumentation._stats.clear()
+        self.addCleanup(restriction_instrumentation._stats.clear)
+        self.Picking = self.env['stock.picking'].with_user(self.user_restricted)
+        self.key = ('stock.picking', '_search', self.user_restricted.id, 'restricted')
+
+    def _set_enabled(self, value):
+        self.env['ir.config_parameter'].sudo().set_param(restriction_instrumentation.INSTRUMENTATION_PARAM, value)
+
+    def test_silent_when_disabled(self):
+        self._set_enabled(False)
+        with self.assertNoLogs(LOGGER, 'INFO'), \
+                patch.object(restriction_instrumentation, 'SUMMARY_INTERVAL', 0):
+            self.Picking.search([])
+        self.assertFalse(restriction_instrumentation._stats)
+
+    def test_collects_and_logs_when_enabled(self):
+        self._set_enabled('1')
+        # Mesures agrégées en mémoire tant que l'intervalle du résumé n'est pas écoulé
+        with patch.object(restriction_instrumentation, '_last_summary', [float('inf')]):
+            self.Picking.search([])
+            self.Picking.search([])
+        entry = restriction_instrumentation._stats[self.key]
+        self.assertEqual(entry['calls'], 2)
+        self.assertEqual(entry['warehouses'], 1)
+        # Paramètres de la requête générée: entrepôts de la restriction
+        self.assertGreater(entry['params'], 0)
+
+        # Intervalle écoulé: résumé écrit dans les logs, mesures remises à zéro
+        with self.assertLogs(LOGGER, 'INFO') as logs, \
+                patch.object(restriction_instrumentation, 'SUMMARY_INTERVAL', 0):
+            self.Picking.search([])
+        self.assertIn('stock.picking._search uid=%s profil=restricted' % self.user_restricted.id, logs.output[0])
+        self.assertIn('appels=3', logs.output[0])
+        self.assertFalse(restriction_instrumentation._stats)
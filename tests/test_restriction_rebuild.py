@@ -0,0 +1,56 @@
+from odoo.tests import tagged
+
+from .common import RestrictionCase
+
+
+@tagged('post_install', '-at_install')
+class TestRestrictionRebuild(RestrictionCase):
+    """Champs de restriction modifiés hors ORM: détectés puis reconstruits"""
+
+    def test_check_and_rebuild_corrupted_rows(self):
+        stock_a = self.warehouse_a.lot_stock_id
+        shelf = self.Location.create({'name': 'Étagère', 'usage': 'internal', 'location_id': stock_a.id})
+        self.env['stock.quant']._update_available_quantity(self.product, stock_a, 5)
+        quant = self.env['stock.quant'].search([('location_id', '=', stock_a.id), ('product_id', '=', self.product.id)])
+        picking = self.create_picking(self.warehouse_a.int_type_id, stock_a, stock_a)
+        picking.action_confirm()
+        picking.action_assign()
+        move, line = picking.move_ids, picking.move_line_ids
+        self.assertTrue(line)
+        self.assertEqual(self.Location._check_restriction_warehouse_consistency(), {})
+
+        # Une ligne corrompue par modèle, en SQL (import, script de maintenance...)
+        self.env.flush_all()
+        for query, record in (
+            ("UPDATE stock_location SET restriction_warehouse_id = %s WHERE id = %s", shelf),
+            ("UPDATE stock_quant SET restriction_warehouse_id = %s WHERE id = %s", quant),
+            ("UPDATE stock_move SET restriction_location_dest_warehouse_id = %s WHERE id = %s", move),
+            ("UPDATE stock_move_line SET restriction_location_warehouse_id = %s WHERE id = %s", line),
+            ("UPDATE stock_picking SET restriction_warehouse_id = %s WHERE id = %s", picking),
+        ):
+            self.cr.execute(query, [self.warehouse_b.id, record.id])
+        self.cr.execute("UPDATE stock_move SET restriction_internal_flow = false WHERE id = %s", [move.id])
+        self.env.invalidate_all()
+
+        self.assertEqual(self.Location._check_restriction_warehouse_consistency(), {
+            'stock.location': shelf.ids,
+            'stock.quant': quant.ids,
+            'stock.move': move.ids,
+            'stock.move.line': line.ids,
+            'stock.picking': picking.ids,
+        })
+
+        updated = self.Location._rebuild_restriction_warehouse()
+        self.assertTrue(all(updated.values()), updated)
+        self.assertEqual(self.Location._check_restriction_warehouse_consistency(), {})
+        self.assertEqual(shelf.restriction_warehouse_id, self.warehouse_a)
+        self.assertEqual(quant.restriction_warehouse_id, self.warehouse_a)
+        self.assertEqual(picking.restriction_warehouse_id, self.warehouse_a)
+        for record in move | line:
+            with self.subTest(model=record._name):
+                self.assertEqual(record.restriction_location_warehouse_id, self.warehouse_a)
+                self.assertEqual(record.restriction_location_dest_warehouse_id, self.warehouse_a)
+                self.assertTrue(record.restriction_internal_flow)
+        # Les recherches d'un utilisateur restreint retrouvent les enregistrements réparés
+        Quant = self.env['stock.quant'].with_user(self.user_restricted)
+        self.assertIn(quant, Quant.search([]))
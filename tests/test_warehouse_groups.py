@@ -0,0 +1,69 @@
+from odoo.tests import tagged
+
+from odoo.addons.restric_entrepot1.models.res_users import PROFILE_NO_WAREHOUSE, PROFILE_RESTRICTED
+from .common import RestrictionCase
+
+
+@tagged('post_install', '-at_install')
+class TestWarehouseGroups(RestrictionCase):
+    """Entrepôts assignés via un groupe d'entrepôts (région)"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.region = cls.env['stock.warehouse.group'].create({
+            'name': 'Région B',
+            'warehouse_ids': [(6, 0, cls.warehouse_b.ids)],
+            'user_ids': [(6, 0, cls.user_no_warehouse.ids)],
+        })
+
+    def _create_picking_b(self):
+        warehouse = self.warehouse_b
+        return self.create_picking(warehouse.int_type_id, warehouse.lot_stock_id, warehouse.lot_stock_id)
+
+    def assertProfile(self, user, profile, warehouses):
+        # Cache de l'ORM vidé: seul le cache des profils (restriction_cache) est mis à l'épreuve
+        self.env.invalidate_all()
+        self.assertEqual(user._get_restriction_profile(), (profile, tuple(sorted(warehouses.ids))))
+
+    def test_group_grants_access(self):
+        picking_b = self._create_picking_b()
+        self.assertProfile(self.user_no_warehouse, PROFILE_RESTRICTED, self.warehouse_b)
+        self.assertProfile(self.user_restricted, PROFILE_RESTRICTED, self.warehouse_a)
+        for model_name, record in (
+            ('stock.picking', picking_b),
+            ('stock.move', picking_b.move_ids),
+            ('stock.location', self.warehouse_b.lot_stock_id),
+        ):
+            with self.subTest(model=model_name):
+                self.assertIn(record, self.env[model_name].with_user(self.user_no_warehouse).search([]))
+                self.assertNotIn(record, self.env[model_name].with_user(self.user_restricted).search([]))
+
+    def test_group_changes_invalidate_profile(self):
+        picking_b = self._create_picking_b()
+        # Profils en cache avant chaque modification
+        self.assertProfile(self.user_restricted, PROFILE_RESTRICTED, self.warehouse_a)
+        self.assertProfile(self.user_no_warehouse, PROFILE_RESTRICTED, self.warehouse_b)
+
+        # Utilisateurs du groupe
+        self.region.user_ids |= self.user_restricted
+        self.assertProfile(self.user_restricted, PROFILE_RESTRICTED, self.warehouse_a | self.warehouse_b)
+        Picking = self.env['stock.picking'].with_user(self.user_restricted)
+        self.assertIn(picking_b, Picking.search([]))
+
+        # Entrepôts du groupe
+        self.region.warehouse_ids = self.warehouse_a
+        self.assertProfile(self.user_restricted, PROFILE_RESTRICTED, self.warehouse_a)
+        self.assertProfile(self.user_no_warehouse, PROFILE_RESTRICTED, self.warehouse_a)
+        self.assertNotIn(picking_b, Picking.search([]))
+
+        # Groupe archivé: ses entrepôts ne sont plus accordés
+        self.region.active = False
+        self.assertProfile(self.user_no_warehouse, PROFILE_NO_WAREHOUSE, self.env['stock.warehouse'])
+        self.assertProfile(self.user_restricted, PROFILE_RESTRICTED, self.warehouse_a)
+
+        # Groupe réactivé, puis groupes retirés depuis l'utilisateur
+        self.region.active = True
+        self.assertProfile(self.user_no_warehouse, PROFILE_RESTRICTED, self.warehouse_a)
+        self.user_no_warehouse.warehouse_group_ids = [(5, 0, 0)]
+        self.assertProfile(self.user_no_warehouse, PROFILE_NO_WAREHOUSE, self.env['stock.warehouse'])